@@ -0,0 +1,96 @@
+"""链接路由微基准
+
+对比旧的线性扫描与 `LinkIndex` 在 10 / 1k / 10k 条链接下的单次查询耗时
+
+    python benchmarks/bench_link_index.py
+"""
+
+import random
+import timeit
+
+import nonebot
+
+nonebot.init()
+nonebot.load_plugin("nonebot_plugin_dcqq_relay")
+
+from nonebot_plugin_dcqq_relay.config import LinkWithWebhook
+from nonebot_plugin_dcqq_relay.route import LinkIndex
+
+SIZES = (10, 1_000, 10_000)
+LOOKUPS = 1_000
+
+
+def build_links(size: int) -> list[LinkWithWebhook]:
+    return [
+        LinkWithWebhook(
+            dc_guild_id=1,
+            dc_channel_id=100_000 + i,
+            qq_group_id=200_000 + i,
+            webhook_id=300_000 + i,
+            webhook_token="x",
+        )
+        for i in range(size)
+    ]
+
+
+def linear_qq(links: list[LinkWithWebhook], group_id: int) -> bool:
+    # check_messages 与 get_link 各扫描一次
+    return any(group_id == link.qq_group_id for link in links) and (
+        next((link for link in links if link.qq_group_id == group_id), None) is not None
+    )
+
+
+def linear_dc(links: list[LinkWithWebhook], channel_id: int, webhook_id: int) -> bool:
+    return any(
+        link.dc_guild_id == 1
+        and link.dc_channel_id == channel_id
+        and link.webhook_id != webhook_id
+        for link in links
+    ) and (
+        next((link for link in links if link.dc_channel_id == channel_id), None)
+        is not None
+    )
+
+
+def indexed_qq(index: LinkIndex, group_id: int) -> bool:
+    return index.get_qq(group_id) is not None
+
+
+def indexed_dc(index: LinkIndex, channel_id: int, webhook_id: int) -> bool:
+    return index.get_dc(1, channel_id) is not None and not index.is_own_webhook(
+        webhook_id
+    )
+
+
+def bench(size: int, rng: random.Random) -> None:
+    links = build_links(size)
+    index = LinkIndex(links, links)
+    groups = [200_000 + rng.randrange(size) for _ in range(LOOKUPS)]
+    channels = [100_000 + rng.randrange(size) for _ in range(LOOKUPS)]
+
+    cases = {
+        "qq": (
+            lambda: [linear_qq(links, g) for g in groups],
+            lambda: [indexed_qq(index, g) for g in groups],
+        ),
+        "discord": (
+            lambda: [linear_dc(links, c, 0) for c in channels],
+            lambda: [indexed_dc(index, c, 0) for c in channels],
+        ),
+    }
+    for case, (linear, indexed) in cases.items():
+        number = 1 if size >= 1_000 else 10
+        linear_us = timeit.timeit(linear, number=number) / number / LOOKUPS * 1e6
+        index_us = timeit.timeit(indexed, number=100) / 100 / LOOKUPS * 1e6
+        print(f"{size:>8} {case:>10} {linear_us:>12.3f} {index_us:>12.3f}")
+
+
+def main() -> None:
+    rng = random.Random(0)
+    print(f"{'links':>8} {'case':>10} {'linear (us)':>12} {'index (us)':>12}")
+    for size in SIZES:
+        bench(size, rng)
+
+
+if __name__ == "__main__":
+    main()
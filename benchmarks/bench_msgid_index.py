@@ -0,0 +1,88 @@
+"""消息 ID 映射表查询基准
+
+在 SQLite 中按 `MsgID` 的表结构填充 N 行数据，分别测量添加
+`dcid` / `qqid` 索引前后按列查询的耗时
+
+    python benchmarks/bench_msgid_index.py [rows ...]
+
+默认测量 1M 与 10M 行，数据库文件写在临时目录中
+"""
+
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+TABLE = "nonebot_plugin_dcqq_relay_msgid"
+DEFAULT_ROWS = (1_000_000, 10_000_000)
+LOOKUPS = 200
+BATCH = 100_000
+
+
+def populate(conn: sqlite3.Connection, rows: int) -> None:
+    conn.execute(
+        f"CREATE TABLE {TABLE} ("
+        + "id INTEGER NOT NULL PRIMARY KEY, "
+        + "dcid BIGINT NOT NULL, qqid INTEGER NOT NULL)"
+    )
+    # 与实际数据相近：dcid 为递增的 snowflake，qqid 为随机的 32 位整数
+    rng = random.Random(0)
+    dcid = 1_100_000_000_000_000_000
+    for start in range(0, rows, BATCH):
+        batch = []
+        for _ in range(min(BATCH, rows - start)):
+            dcid += rng.randrange(1, 1 << 22)
+            batch.append((dcid, rng.randrange(-(1 << 31), 1 << 31)))
+        conn.executemany(f"INSERT INTO {TABLE} (dcid, qqid) VALUES (?, ?)", batch)
+    conn.commit()
+
+
+def measure(conn: sqlite3.Connection, column: str, keys: list[int]) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        conn.execute(
+            f"SELECT dcid, qqid FROM {TABLE} WHERE {column} = ?", (key,)
+        ).fetchall()
+        conn.execute(
+            f"SELECT 1 FROM {TABLE} WHERE {column} = ? LIMIT 1", (key,)
+        ).fetchone()
+    return (time.perf_counter() - start) / len(keys) / 2 * 1e3
+
+
+def sample(conn: sqlite3.Connection, column: str, rows: int) -> list[int]:
+    rng = random.Random(1)
+    return [
+        conn.execute(
+            f"SELECT {column} FROM {TABLE} WHERE id = ?", (rng.randrange(1, rows),)
+        ).fetchone()[0]
+        for _ in range(LOOKUPS)
+    ]
+
+
+def bench(rows: int) -> None:
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as db:
+        conn = sqlite3.connect(db.name)
+        populate(conn, rows)
+        keys = {column: sample(conn, column, rows) for column in ("dcid", "qqid")}
+
+        before = {column: measure(conn, column, keys[column][:20]) for column in keys}
+        for column in keys:
+            conn.execute(f"CREATE INDEX ix_{TABLE}_{column} ON {TABLE} ({column})")
+        conn.commit()
+        after = {column: measure(conn, column, keys[column]) for column in keys}
+        conn.close()
+
+    for column in keys:
+        print(f"{rows:>11,} {column:>6} {before[column]:>14.3f} {after[column]:>14.4f}")
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_ROWS
+    print(f"{'rows':>11} {'column':>6} {'no index (ms)':>14} {'index (ms)':>14}")
+    for rows in sizes:
+        bench(rows)
+
+
+if __name__ == "__main__":
+    main()
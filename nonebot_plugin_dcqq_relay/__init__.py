@@ -1,34 +1,64 @@
 import asyncio
+from collections.abc import Sequence
 
-from nonebot import get_driver, logger, on, require
-from nonebot.adapters import Event
+from nonebot import get_driver, logger, on, on_notice, require
+from nonebot.adapters import Bot, Event
 from nonebot.adapters.discord import (
     Bot as dc_Bot,
+    GuildMemberRemoveEvent,
+    GuildMemberUpdateEvent,
     GuildMessageCreateEvent,
     GuildMessageDeleteEvent,
 )
 from nonebot.adapters.onebot.v11 import (
     Bot as qq_Bot,
+    GroupDecreaseNoticeEvent,
+    GroupIncreaseNoticeEvent,
     GroupMessageEvent,
     GroupRecallNoticeEvent,
+    NoticeEvent,
 )
 from nonebot.params import Depends
 from nonebot.plugin import PluginMetadata
-from nonebot.rule import Rule, StartswithRule
+from nonebot.rule import Rule, StartswithRule, is_type
 from nonebot.typing import T_State
 
 require("nonebot_plugin_orm")
 require("nonebot_plugin_localstore")
 
+from .cache import DeleteEcho
 from .config import (
     Config,
     LinkWithWebhook,
+    coalesce_max_length,
+    coalesce_window,
+    delete_echo_size,
+    delete_echo_ttl,
+    msgid_retention_days,
     only_to_me,
+    qq_member_prefetch,
     unmatch_beginning,
+    upload_cache_interval,
+)
+from .dc_to_qq import create_dc_to_qq, delete_dc_to_qq, forget_file_mode
+from .guilds import GUILD_META_EVENTS, GuildMetaEvent, guild_store
+from .qq_to_dc import PendingText, create_qq_to_dc, delete_qq_to_dc
+from .route import BotNotConnected
+from .sequencer import Sequencer
+from .staging import remove_leftovers, upload_staging
+from .store import flush as flush_msgids, prune_forever, stats as msgid_stats
+from .transcode import transcoder
+from .utils import (
+    check_messages,
+    check_to_me,
+    dc_bots,
+    get_link,
+    get_webhooks,
+    invalidate_dc_member,
+    invalidate_qq_group,
+    prefetch_qq_members,
+    qq_bots,
 )
-from .dc_to_qq import create_dc_to_qq, delete_dc_to_qq
-from .qq_to_dc import create_qq_to_dc, delete_qq_to_dc
-from .utils import check_messages, check_to_me, get_link, get_webhooks
 
 __plugin_meta__ = PluginMetadata(
     name="QQ群-Discord 互通",
@@ -42,7 +72,10 @@ __plugin_meta__ = PluginMetadata(
 
 
 driver = get_driver()
-just_delete = []
+just_delete = DeleteEcho(delete_echo_ttl, delete_echo_size)
+link_sequencer: Sequencer[tuple[int, int, str]] = Sequencer()
+pending_texts: dict[tuple[int, int, str], PendingText] = {}
+background_tasks: set[asyncio.Task] = set()
 
 
 class NotStartswithRule(StartswithRule):
@@ -59,6 +92,50 @@ matcher = on(
     priority=2,
 )
 
+member_changed = on_notice(
+    rule=is_type(GuildMemberUpdateEvent, GuildMemberRemoveEvent),
+    priority=1,
+    block=False,
+)
+
+
+@member_changed.handle()
+async def invalidate_member(event: GuildMemberUpdateEvent | GuildMemberRemoveEvent):
+    invalidate_dc_member(event.guild_id, int(event.user.id))
+
+
+guild_changed = on_notice(rule=is_type(*GUILD_META_EVENTS), priority=1, block=False)
+
+
+@guild_changed.handle()
+async def update_guild_store(event: GuildMetaEvent):
+    guild_store.handle(event)
+
+
+def is_qq_member_notice(event: NoticeEvent) -> bool:
+    return (
+        isinstance(event, GroupIncreaseNoticeEvent | GroupDecreaseNoticeEvent)
+        or event.notice_type == "group_card"
+    )
+
+
+qq_member_changed = on_notice(rule=is_qq_member_notice, priority=1, block=False)
+
+
+@qq_member_changed.handle()
+async def invalidate_qq_members(event: NoticeEvent):
+    # 成员列表在下次查询时重新载入
+    if (group_id := getattr(event, "group_id", None)) is not None:
+        invalidate_qq_group(int(group_id))
+
+
+@driver.on_bot_connect
+async def prefetch_members(bot: qq_Bot):
+    if qq_member_prefetch:
+        task = asyncio.create_task(prefetch_qq_members(bot))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
 
 @driver.on_bot_connect
 async def prepare_webhooks(bot: dc_Bot):
@@ -71,6 +148,49 @@ async def prepare_webhooks(bot: dc_Bot):
         )
 
 
+@driver.on_bot_connect
+async def register_bot(bot: Bot):
+    qq_bots.connect(bot)
+    dc_bots.connect(bot)
+    if isinstance(bot, qq_Bot):
+        # 重连后可能换了 OneBot 实现
+        forget_file_mode(bot)
+
+
+@driver.on_bot_disconnect
+async def unregister_bot(bot: Bot):
+    qq_bots.disconnect(bot)
+    dc_bots.disconnect(bot)
+    if isinstance(bot, qq_Bot):
+        forget_file_mode(bot)
+
+
+@driver.on_startup
+async def start_transcoder():
+    # 先于本插件的其它启动任务（`to_thread` 等）创建进程池
+    transcoder.start()
+
+
+@driver.on_startup
+async def start_background_tasks():
+    if msgid_retention_days > 0:
+        background_tasks.add(asyncio.create_task(prune_forever()))
+    if removed := await asyncio.to_thread(remove_leftovers):
+        logger.info(f"removed {removed} leftover files from cache dir")
+    background_tasks.add(
+        asyncio.create_task(upload_staging.cleanup_forever(upload_cache_interval))
+    )
+
+
+@driver.on_shutdown
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    transcoder.shutdown()
+    await flush_msgids()
+
+
 @matcher.handle()
 async def message_relay(
     bot: qq_Bot | dc_Bot,
@@ -86,11 +206,79 @@ async def message_relay(
         logger.warning("fail to get channel link")
         await matcher.finish()
         return
+    # 两个方向各自排队，Discord 侧的慢消息不会阻塞 QQ 侧，反之亦然
+    key = (
+        link.qq_group_id,
+        link.dc_channel_id,
+        "qq" if isinstance(bot, qq_Bot) else "dc",
+    )
+    if coalesce_window > 0:
+        batch = pending_texts.pop(key, None)
+        if (
+            isinstance(bot, qq_Bot)
+            and isinstance(event, GroupMessageEvent)
+            and PendingText.is_text_only(event)
+        ):
+            if batch is not None and batch.add(event, coalesce_max_length):
+                # 并入等待中的消息，由第一条消息的处理流程发送
+                pending_texts[key] = batch
+                await asyncio.shield(batch.done)
+                return
+            if batch is not None:
+                flush_pending(key, batch)
+            batch = pending_texts[key] = PendingText(bot, event, link)
+            # 在队列外等待合并窗口，窗口结束后才排队，不占用链接队列
+            try:
+                await batch.wait(coalesce_window)
+            finally:
+                sent = flush_pending(key, batch)
+            await sent
+            return
+        if batch is not None:
+            # 其它消息到达时先把等待中的消息排进队列，保持顺序
+            flush_pending(key, batch)
+    # 同一链接的消息按收到的顺序转发
+    await link_sequencer.run(key, lambda: relay(bot, event, link))
+    logger.debug(f"link sequencer: {link_sequencer.stats()}")
+
+
+def flush_pending(key: tuple[int, int, str], batch: PendingText) -> asyncio.Future:
+    """结束合并并把合并后的消息排进链接队列，重复调用时返回同一个 future"""
+    if batch.sent is not None:
+        return batch.sent
+    batch.closed.set()
+    if pending_texts.get(key) is batch:
+        del pending_texts[key]
+
+    def finish(_: asyncio.Future) -> None:
+        # 无论发送成功、失败还是被撤回，都要放行被合并的消息
+        if not batch.done.done():
+            batch.done.set_result(None)
+
+    batch.sent = link_sequencer.submit(
+        key,
+        lambda: relay(batch.bot, batch.events[0], batch.link, batch.events[1:]),
+    )
+    batch.sent.add_done_callback(finish)
+    return batch.sent
+
+
+async def relay(
+    bot: qq_Bot | dc_Bot,
+    event: (
+        GroupMessageEvent
+        | GuildMessageCreateEvent
+        | GroupRecallNoticeEvent
+        | GuildMessageDeleteEvent
+    ),
+    link: LinkWithWebhook,
+    merged: Sequence[GroupMessageEvent] = (),
+):
     logger.debug("message relay: start")
     for try_times in range(3):
         try:
             if isinstance(bot, qq_Bot) and isinstance(event, GroupMessageEvent):
-                await create_qq_to_dc(bot, event, link)
+                await create_qq_to_dc(bot, event, link, merged)
             elif isinstance(bot, dc_Bot) and isinstance(event, GuildMessageCreateEvent):
                 await create_dc_to_qq(bot, event, link)
             elif isinstance(bot, qq_Bot) and isinstance(event, GroupRecallNoticeEvent):
@@ -102,7 +290,14 @@ async def message_relay(
                     "bot type and event type not match: "
                     + f"bot - {bot.type}, event - {type(event)}"
                 )
-            logger.debug("message relay: done")
+            logger.debug(
+                f"message relay: done, delete echo: {just_delete.stats()}, "
+                f"msgid store: {msgid_stats()}"
+            )
+            break
+        except BotNotConnected as e:
+            # 对端机器人不在线，重试也无济于事
+            logger.warning(f"message relay skipped: {e}")
             break
         except NameError as e:
             logger.warning(f"message relay error: {e}, retry {try_times + 1}")
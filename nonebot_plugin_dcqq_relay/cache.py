@@ -0,0 +1,246 @@
+import asyncio
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable, Hashable
+from time import monotonic
+from typing import Generic, TypeVar
+
+from nonebot import logger
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class ExpiringSet(Generic[K]):
+    """按时间分桶过期、有容量上限的集合
+
+    元素按加入时间落入宽度为 `ttl / buckets` 的桶中，整桶过期，
+    加入、查询、删除均为 O(1)（桶数固定）
+    """
+
+    ttl: float
+    maxsize: int
+    _width: float
+    _buckets: deque[tuple[float, set[K]]]
+    _size: int
+
+    __slots__ = ("_buckets", "_size", "_width", "maxsize", "ttl")
+
+    def __init__(self, ttl: float, maxsize: int, buckets: int = 8):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._width = ttl / buckets
+        self._buckets = deque()
+        self._size = 0
+
+    def __len__(self) -> int:
+        self._expire(monotonic())
+        return self._size
+
+    def __contains__(self, key: object) -> bool:
+        self._expire(monotonic())
+        return any(key in bucket for _, bucket in self._buckets)
+
+    def add(self, key: K) -> None:
+        now = monotonic()
+        self._expire(now)
+        if not self._buckets or now - self._buckets[-1][0] >= self._width:
+            self._buckets.append((now, set()))
+        bucket = self._buckets[-1][1]
+        if key not in bucket:
+            self.discard(key)
+            bucket.add(key)
+            self._size += 1
+        while self._size > self.maxsize:
+            # discard 可能留下空桶
+            oldest = self._buckets[0][1]
+            if oldest:
+                oldest.pop()
+                self._size -= 1
+            if not oldest:
+                self._buckets.popleft()
+
+    def discard(self, key: K) -> bool:
+        """删除元素，返回元素是否存在"""
+        for _, bucket in self._buckets:
+            if key in bucket:
+                bucket.remove(key)
+                self._size -= 1
+                return True
+        return False
+
+    def pop(self, key: K) -> bool:
+        """若元素存在且未过期则删除并返回 True"""
+        self._expire(monotonic())
+        return self.discard(key)
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._size = 0
+
+    def _expire(self, now: float) -> None:
+        while self._buckets and now - self._buckets[0][0] >= self.ttl:
+            self._size -= len(self._buckets.popleft()[1])
+
+
+class DeleteEcho:
+    """刚由本插件撤回的消息 ID，用于忽略对应的撤回事件
+
+    QQ 与 Discord 的消息 ID 分开存放
+    """
+
+    qq: ExpiringSet[int]
+    dc: ExpiringSet[int]
+
+    __slots__ = ("dc", "qq")
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.qq = ExpiringSet(ttl, maxsize)
+        self.dc = ExpiringSet(ttl, maxsize)
+
+    def stats(self) -> dict[str, int]:
+        return {"qq": len(self.qq), "dc": len(self.dc)}
+
+
+class LRUCache(Generic[K, V]):
+    """有容量上限的 LRU 缓存，记录命中率
+
+    指定 `ttl` 时条目各自过期，`set` 还可为单个条目指定较短的过期时间
+    （如缓存查询失败的结果），过期条目在读取时删除
+    """
+
+    capacity: int
+    ttl: float | None
+    hits: int
+    misses: int
+    _data: OrderedDict[K, V]
+    _expires: dict[K, float]
+
+    __slots__ = ("_data", "_expires", "capacity", "hits", "misses", "ttl")
+
+    def __init__(self, capacity: int, ttl: float | None = None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._expires = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def get(self, key: K) -> V | None:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        if self._expires and self._expires.get(key, float("inf")) <= monotonic():
+            self.pop(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        if self.capacity <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is not None:
+            self._expires[key] = monotonic() + ttl
+        elif self._expires:
+            self._expires.pop(key, None)
+        while len(self._data) > self.capacity:
+            evicted, _ = self._data.popitem(last=False)
+            if self._expires:
+                self._expires.pop(evicted, None)
+
+    def pop(self, key: K) -> V | None:
+        if self._expires:
+            self._expires.pop(key, None)
+        return self._data.pop(key, None)
+
+    def items(self) -> list[tuple[K, V]]:
+        return list(self._data.items())
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._expires.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+class _Call(Generic[V]):
+    task: asyncio.Task[V]
+    waiters: int
+    served: int
+
+    __slots__ = ("served", "task", "waiters")
+
+    def __init__(self, task: asyncio.Task[V]):
+        self.task = task
+        self.waiters = 0
+        self.served = 0
+
+
+class SingleFlight(Generic[K, V]):
+    """合并相同键的并发调用，同一时间每个键只执行一次
+
+    等待者被取消时只退出自身的等待，所有等待者都取消后才取消实际的调用
+    """
+
+    coalesced: int
+    _calls: dict[K, _Call[V]]
+
+    __slots__ = ("_calls", "coalesced")
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: K, func: Callable[[], Awaitable[V]]) -> V:
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(func()))
+            call.task.add_done_callback(lambda _: self._done(key, call))
+        else:
+            self.coalesced += 1
+        call.waiters += 1
+        call.served += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 立即移除，之后的调用者开始新的调用而不是加入正在取消的调用
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+
+    def stats(self) -> dict[str, int]:
+        return {"in_flight": len(self._calls), "coalesced": self.coalesced}
+
+    def _done(self, key: K, call: _Call[V]) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if call.served > 1:
+            logger.debug(f"single flight: {key} served {call.served} waiters")
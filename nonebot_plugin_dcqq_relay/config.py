@@ -27,10 +27,109 @@ class Config(BaseModel):
     dcqq_relay_unmatch_beginning: list[str] = ["/"]
     """不转发的消息开头"""
     dcqq_relay_only_to_me: bool = False
+    dcqq_relay_delete_echo_ttl: float = 120
+    """撤回回声记录的保留时间（秒）"""
+    dcqq_relay_delete_echo_size: int = 1024
+    """撤回回声记录的容量上限（每个方向）"""
+    dcqq_relay_msgid_cache_size: int = 4096
+    """消息 ID 映射缓存的容量（每个方向），为 0 时不缓存"""
+    dcqq_relay_msgid_flush_interval: int = 0
+    """消息 ID 映射批量写入的间隔（毫秒），为 0 时每条消息单独写入"""
+    dcqq_relay_msgid_flush_rows: int = 100
+    """缓冲区达到该行数时立即批量写入"""
+    dcqq_relay_msgid_retention_days: int = 0
+    """消息 ID 映射的保留天数，为 0 时永久保留"""
+    dcqq_relay_msgid_prune_interval: int = 3600
+    """清理过期映射的间隔（秒）"""
+    dcqq_relay_msgid_prune_chunk: int = 1000
+    """每批删除的最大行数"""
+    dcqq_relay_msgid_prune_vacuum: bool = False
+    """清理后对 SQLite 执行 VACUUM 与 ANALYZE"""
+    dcqq_relay_media_cache_size: int = 256
+    """媒体缓存的容量（MiB），为 0 时不缓存"""
+    dcqq_relay_media_cache_static_ttl: int = 2592000
+    """表情、贴纸等不会变化的媒体的缓存时间（秒）"""
+    dcqq_relay_media_cache_attachment_ttl: int = 86400
+    """图片、附件等链接会过期的媒体的缓存时间（秒）"""
+    dcqq_relay_download_max_size: int = 100
+    """视频、文件的下载大小上限（MiB）"""
+    dcqq_relay_download_spool_size: int = 8
+    """超过该大小（MiB）的下载内容写入缓存目录中的临时文件"""
+    dcqq_relay_transcode_workers: int = 2
+    """音频转码进程数"""
+    dcqq_relay_transcode_queue_size: int = 16
+    """等待转码的任务数上限，超出时在事件循环中排队"""
+    dcqq_relay_transcode_timeout: float = 60
+    """单个转码任务（含排队）的超时时间（秒）"""
+    dcqq_relay_transcode_cache_size: int = 64
+    """转码结果缓存的容量（MiB），为 0 时不缓存"""
+    dcqq_relay_file_wait_timeout: float = 10
+    """等待 OneBot 实现写完视频文件的最长时间（秒）"""
+    dcqq_relay_record_wait_timeout: float = 0.3
+    """等待 OneBot 实现写完语音文件的最长时间（秒），超时后改用 url 下载"""
+    dcqq_relay_member_cache_ttl: float = 600
+    """成员昵称缓存的过期时间（秒）"""
+    dcqq_relay_member_cache_negative_ttl: float = 60
+    """查询成员失败（如未知用户）时结果的缓存时间（秒）"""
+    dcqq_relay_member_cache_size: int = 4096
+    """成员昵称缓存的条目数（QQ 为群数）上限，为 0 时不缓存"""
+    dcqq_relay_qq_member_prefetch: bool = True
+    """QQ 机器人连接时预先载入互通群的成员列表"""
+    dcqq_relay_upload_cache_size: int = 1024
+    """暂存待发送文件的目录容量（MiB）"""
+    dcqq_relay_upload_cache_ttl: float = 86400
+    """暂存的文件超过该时间（秒）未使用时删除"""
+    dcqq_relay_upload_cache_interval: float = 600
+    """清理暂存文件的间隔（秒）"""
+    dcqq_relay_webhook_rate_limit: int = 5
+    """每个 webhook 在一个时间窗口内的请求数上限，为 0 时不限制"""
+    dcqq_relay_webhook_rate_period: float = 2
+    """webhook 速率限制的时间窗口（秒）"""
+    dcqq_relay_global_rate_limit: int = 50
+    """每个 Discord 机器人每秒的请求数上限，为 0 时不限制"""
+    dcqq_relay_webhook_rate_retries: int = 3
+    """webhook 被限速（429）时的重试次数"""
+    dcqq_relay_coalesce_window: float = 0
+    """合并同一发送者连续纯文本 QQ 消息的时间窗口（秒），为 0 时不合并"""
+    dcqq_relay_coalesce_max_length: int = 2000
+    """合并后消息的最大长度（字符）"""
 
 
 plugin_config = get_plugin_config(Config)
 channel_links = plugin_config.dcqq_relay_channel_links
 unmatch_beginning = plugin_config.dcqq_relay_unmatch_beginning
 only_to_me = plugin_config.dcqq_relay_only_to_me
+delete_echo_ttl = plugin_config.dcqq_relay_delete_echo_ttl
+delete_echo_size = plugin_config.dcqq_relay_delete_echo_size
+msgid_cache_size = plugin_config.dcqq_relay_msgid_cache_size
+msgid_flush_interval = plugin_config.dcqq_relay_msgid_flush_interval
+msgid_flush_rows = plugin_config.dcqq_relay_msgid_flush_rows
+msgid_retention_days = plugin_config.dcqq_relay_msgid_retention_days
+msgid_prune_interval = plugin_config.dcqq_relay_msgid_prune_interval
+msgid_prune_chunk = plugin_config.dcqq_relay_msgid_prune_chunk
+msgid_prune_vacuum = plugin_config.dcqq_relay_msgid_prune_vacuum
+media_cache_size = plugin_config.dcqq_relay_media_cache_size
+media_cache_static_ttl = plugin_config.dcqq_relay_media_cache_static_ttl
+media_cache_attachment_ttl = plugin_config.dcqq_relay_media_cache_attachment_ttl
+download_max_size = plugin_config.dcqq_relay_download_max_size * 1024 * 1024
+download_spool_size = plugin_config.dcqq_relay_download_spool_size * 1024 * 1024
+transcode_workers = plugin_config.dcqq_relay_transcode_workers
+transcode_queue_size = plugin_config.dcqq_relay_transcode_queue_size
+transcode_timeout = plugin_config.dcqq_relay_transcode_timeout
+transcode_cache_size = plugin_config.dcqq_relay_transcode_cache_size
+file_wait_timeout = plugin_config.dcqq_relay_file_wait_timeout
+record_wait_timeout = plugin_config.dcqq_relay_record_wait_timeout
+member_cache_ttl = plugin_config.dcqq_relay_member_cache_ttl
+member_cache_negative_ttl = plugin_config.dcqq_relay_member_cache_negative_ttl
+member_cache_size = plugin_config.dcqq_relay_member_cache_size
+qq_member_prefetch = plugin_config.dcqq_relay_qq_member_prefetch
+upload_cache_size = plugin_config.dcqq_relay_upload_cache_size
+upload_cache_ttl = plugin_config.dcqq_relay_upload_cache_ttl
+upload_cache_interval = plugin_config.dcqq_relay_upload_cache_interval
+webhook_rate_limit = plugin_config.dcqq_relay_webhook_rate_limit
+webhook_rate_period = plugin_config.dcqq_relay_webhook_rate_period
+global_rate_limit = plugin_config.dcqq_relay_global_rate_limit
+webhook_rate_retries = plugin_config.dcqq_relay_webhook_rate_retries
+coalesce_window = plugin_config.dcqq_relay_coalesce_window
+coalesce_max_length = plugin_config.dcqq_relay_coalesce_max_length
 discord_proxy = get_plugin_config(dc_Config).discord_proxy
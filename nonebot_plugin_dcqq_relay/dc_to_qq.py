@@ -4,7 +4,7 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any
 
-from nonebot import get_bots, logger
+from nonebot import logger
 from nonebot.adapters.discord import (
     Bot as dc_Bot,
     GuildMessageCreateEvent,
@@ -29,36 +29,54 @@ from nonebot.adapters.onebot.v11 import (
     Message as qq_M,
     MessageSegment as qq_MS,
 )
-from nonebot_plugin_localstore import get_plugin_cache_dir
-from nonebot_plugin_orm import get_session
-from sqlalchemy import select
 
+from .cache import DeleteEcho
 from .config import Link, discord_proxy
-from .model import MsgID
+from .guilds import guild_store
+from .staging import upload_staging
+from .store import Scope, delete_by_dcid, get_qqids, save_msgids
+from .transcode import TranscodeError, TranscodeTimeout, to_format
 from .utils import (
+    DownloadTooLarge,
     get_dc_member_name,
     get_file_bytes,
-    pydub_transform,
+    qq_bots,
+    stream_file,
 )
 
-cache_dir = get_plugin_cache_dir()
-
 
 async def get_dc_channel_name(bot: dc_Bot, channel_id: int) -> str:
+    if (name := guild_store.channel_name(channel_id)) is not None:
+        return name
     try:
-        name = (await bot.get_channel(channel_id=channel_id)).name
+        channel = await bot.get_channel(channel_id=channel_id)
     except ActionFailed:
-        name = None
-
-    return name if isinstance(name, str) else "(error:未知频道)"
+        return "(error:未知频道)"
+    guild_store.set_channel(channel)
+    return channel.name if isinstance(channel.name, str) else "(error:未知频道)"
 
 
 async def get_dc_role_name(bot: dc_Bot, guild_id: int, role_id: int) -> str:
+    if (name := guild_store.role_name(guild_id, role_id)) is not None:
+        return name
     try:
-        name = (await bot.get_guild_role(guild_id=guild_id, role_id=role_id)).name
+        role = await bot.get_guild_role(guild_id=guild_id, role_id=role_id)
     except ActionFailed:
-        name = "(error:未知身份组)"
+        return "(error:未知身份组)"
+    guild_store.set_role(guild_id, role)
+    return role.name
+
 
+async def get_dc_guild_name(bot: dc_Bot, guild_id: int) -> str | None:
+    if (name := guild_store.guild_name(guild_id)) is not None:
+        return name
+    try:
+        name = (await bot.get_guild_preview(guild_id=guild_id)).name
+    except ActionFailed as e:
+        if e.message == "Unknown Guild":
+            return None
+        raise e
+    guild_store.set_guild_name(guild_id, name)
     return name
 
 
@@ -72,28 +90,67 @@ async def upload_group_file(bot: qq_Bot, group_id: int, file: qq_M):
     )
 
 
-async def prepare_file(bot: qq_Bot, files: list[qq_M]) -> tuple[list[qq_M], bool]:
-    need_upload: bool = False
-    version_info = await bot.get_version_info()
+BASE64 = "base64"
+"""NapCat：文件以 base64 发送"""
+UPLOAD = "upload"
+"""Lagrange：文件保存到本地后调用 upload_group_file 上传"""
+PATH = "path"
+"""其它实现：文件保存到本地后以路径发送"""
+
+STAGING_SUFFIXES = {"video": ".mp4"}
+"""没有文件名的消息段暂存时使用的扩展名"""
+
+file_modes: dict[str, str] = {}
+
+
+async def get_file_mode(bot: qq_Bot) -> str:
+    """按 OneBot 实现确定发送文件的方式，每次连接只查询一次"""
+    if (mode := file_modes.get(bot.self_id)) is not None:
+        return mode
+    app_name = (await bot.get_version_info())["app_name"]
+    if app_name == "NapCat.Onebot":
+        mode = BASE64
+    elif app_name == "Lagrange.OneBot":
+        mode = UPLOAD
+    else:
+        mode = PATH
+    file_modes[bot.self_id] = mode
+    return mode
+
+
+def forget_file_mode(bot: qq_Bot) -> None:
+    file_modes.pop(bot.self_id, None)
 
-    if version_info["app_name"] == "NapCat.Onebot":
-        for file in files:
-            file[0].data["file"] = f2s(file[0].data["file"])
-        return files, need_upload
 
-    if version_info["app_name"] == "Lagrange.OneBot":
-        need_upload = True
-    for file in files:
-        file[0].data["file"] = (
-            save_file(file[0].data["file"], file[0].data["name"])
-        ).as_posix()
-    return files, need_upload
+def to_base64(file: bytes | Path) -> str:
+    return f2s(file.read_bytes() if isinstance(file, Path) else file)
 
 
-def save_file(file: bytes, file_name: str) -> Path:
-    file_path = cache_dir / file_name
-    file_path.write_bytes(file)
-    return file_path
+async def prepare_file(
+    bot: qq_Bot, files: list[qq_M], videos: list[qq_M] | None = None
+) -> tuple[list[qq_M], bool, list[Path]]:
+    """按 OneBot 实现处理文件与视频，返回 (文件消息, 是否需要上传, 暂存的文件)
+
+    只有以路径发送或需要上传时才写入暂存目录，其余情况以 base64 发送，
+    避免 OneBot 实现与本插件不在同一文件系统时读不到文件。
+    暂存的文件在发送完成后需要交给 `upload_staging.release`
+    """
+    mode = await get_file_mode(bot)
+
+    staged = []
+    for message in (*(videos or ()), *files):
+        seg = message[0]
+        if mode == PATH or (mode == UPLOAD and seg.type == "file"):
+            path = await upload_staging.save(
+                seg.data["file"],
+                seg.data.get("name", ""),
+                STAGING_SUFFIXES.get(seg.type, ""),
+            )
+            staged.append(path)
+            seg.data["file"] = path.as_posix()
+        else:
+            seg.data["file"] = await asyncio.to_thread(to_base64, seg.data["file"])
+    return files, mode == UPLOAD, staged
 
 
 async def ensure_message(
@@ -134,19 +191,33 @@ async def gather_send(
     msg_to_send: list[qq_M],
     files: list[qq_M],
 ) -> list[dict[str, Any]]:
-    tasks = []
-    files, need_upload = await prepare_file(bot, files)
-
-    if need_upload:
-        tasks.extend(upload_group_file(bot, qq_group_id, file) for file in files)
-    else:
-        msg_to_send += files
-    tasks = [
-        bot.send_group_msg(group_id=qq_group_id, message=message)
+    need_upload = False
+    staged: list[Path] = []
+    # 视频下载后保留原始内容，按实现决定以 base64 还是路径发送
+    videos = [
+        message
         for message in msg_to_send
-    ] + tasks
+        if len(message) == 1
+        and message[0].type == "video"
+        and isinstance(message[0].data["file"], bytes | Path)
+    ]
+    if files or videos:
+        files, need_upload, staged = await prepare_file(bot, files, videos)
+    if not need_upload:
+        msg_to_send += files
 
-    sends = await asyncio.gather(*tasks)
+    # 逐条发送，保证文字、视频、文件在 QQ 上的顺序
+    sends = []
+    try:
+        for message in msg_to_send:
+            sends.append(
+                await bot.send_group_msg(group_id=qq_group_id, message=message)
+            )
+        if need_upload:
+            for file in files:
+                await upload_group_file(bot, qq_group_id, file)
+    finally:
+        upload_staging.release(staged)
     return [send for send in sends if send is not None]
 
 
@@ -157,39 +228,40 @@ async def create_dc_to_qq(
 ):
     """discord 消息转发到 QQ"""
     logger.debug("create dc to qq: start")
-    qq_bot: qq_Bot = next(
-        bot
-        for self_id, bot in get_bots().items()
-        if isinstance(bot, qq_Bot)
-        and ((self_id == link.qq_bot_id) if link.qq_bot_id else True)
-    )
+    qq_bot = qq_bots.resolve(link)
     event = await ensure_message(bot, event)
     seg_msg = dc_M.from_guild_message(event)
 
-    messages = await MessageBuilder().build(seg_msg, bot, event)
+    builder = MessageBuilder()
+    messages = await builder.build(seg_msg, bot, event)
     msg_to_send, files = split_messages(messages)
 
-    for try_times in range(3):
-        try:
-            sends = await gather_send(
-                qq_bot,
-                link.qq_group_id,
-                msg_to_send,
-                files,
-            )
-            break
-        except NameError as e:
-            logger.warning(f"create dc to qq error: {e}, retry {try_times + 1}")
-            if try_times == 2:
-                continue
-            await asyncio.sleep(5)
-    else:
-        logger.error("create dc to qq: failed")
-        return
+    try:
+        for try_times in range(3):
+            try:
+                sends = await gather_send(
+                    qq_bot,
+                    link.qq_group_id,
+                    msg_to_send,
+                    files,
+                )
+                break
+            except NameError as e:
+                logger.warning(f"create dc to qq error: {e}, retry {try_times + 1}")
+                if try_times == 2:
+                    continue
+                await asyncio.sleep(5)
+        else:
+            logger.error("create dc to qq: failed")
+            return
+    finally:
+        for path in builder.spooled:
+            path.unlink(missing_ok=True)
 
-    async with get_session() as session:
-        session.add_all(MsgID(dcid=event.id, qqid=send["message_id"]) for send in sends)
-        await session.commit()
+    await save_msgids(
+        Scope.of(link, qq_bot.self_id),
+        ((event.id, send["message_id"]) for send in sends),
+    )
 
     logger.debug("create dc to qq done")
 
@@ -197,29 +269,19 @@ async def create_dc_to_qq(
 async def delete_dc_to_qq(
     event: GuildMessageDeleteEvent,
     link: Link,
-    just_delete: list,
+    just_delete: DeleteEcho,
 ):
     logger.debug("delete dc to qq: start")
-    if (id := event.id) in just_delete:
-        just_delete.remove(id)
+    if just_delete.dc.pop(event.id):
         return
-    qq_bot: qq_Bot = next(
-        bot
-        for self_id, bot in get_bots().items()
-        if isinstance(bot, qq_Bot)
-        and ((self_id == link.qq_bot_id) if link.qq_bot_id else True)
-    )
+    qq_bot = qq_bots.resolve(link)
     for try_times in range(3):
         try:
-            async with get_session() as session:
-                if msgids := await session.scalars(
-                    select(MsgID).filter(MsgID.dcid == event.id)
-                ):
-                    for msgid in msgids:
-                        await qq_bot.delete_msg(message_id=msgid.qqid)
-                        just_delete.append(msgid.qqid)
-                        await session.delete(msgid)
-                    await session.commit()
+            if qqids := await get_qqids(event.id, dc_channel_id=link.dc_channel_id):
+                for qqid in qqids:
+                    await qq_bot.delete_msg(message_id=qqid)
+                    just_delete.qq.add(qqid)
+                await delete_by_dcid(Scope.of(link, qq_bot.self_id), event.id, qqids)
             logger.debug("delete dc to qq: done")
             break
         except (UnboundLocalError, TypeError, NameError) as e:
@@ -239,8 +301,11 @@ class MessageBuilder:
             Coroutine[Any, Any, qq_M | qq_MS | None],
         ],
     ]
+    spooled: list[Path]
+    """流式下载写入的临时文件，发送后删除"""
 
     def __init__(self):
+        self.spooled = []
         self._mapping = {
             "attachment": self.attachment,
             "sticker": self.sticker,
@@ -278,7 +343,7 @@ class MessageBuilder:
             is_not_unset(referenced_message := event.referenced_message)
             and referenced_message is not None
         ):
-            result.append(self.handle_referenced_message(referenced_message))
+            result.append(self.handle_referenced_message(referenced_message, event))
 
         if is_not_unset(event.message_snapshots) and event.message_snapshots:
             result.extend(
@@ -318,33 +383,47 @@ class MessageBuilder:
                 await get_file_bytes(bot, attachment.url, discord_proxy), type_=filetype
             )
         if "video" in content_type:
-            return qq_MS.video(await get_file_bytes(bot, attachment.url, discord_proxy))
+            content = await self.stream_attachment(attachment, bot)
+            if not content:
+                return qq_MS.text(f"[{filename}]")
+            return qq_MS("video", {"file": content})
         if "audio" in content_type and hasattr(attachment, "duration_secs"):
-            return qq_MS.record(
-                pydub_transform(
+            try:
+                record = await to_format(
                     await get_file_bytes(bot, attachment.url, discord_proxy),
                     filetype,
                     "mp3",
                 )
-            )
-        return qq_MS(
-            "file",
-            {
-                "file": await get_file_bytes(bot, attachment.url, discord_proxy),
-                "name": filename,
-            },
-        )
+            except (TranscodeTimeout, TranscodeError) as e:
+                logger.warning(f"handle attachment: {e}")
+                return qq_MS.text(f"[{filename}]")
+            return qq_MS.record(record)
+        if not (content := await self.stream_attachment(attachment, bot)):
+            return qq_MS.text(f"[{filename}]")
+        return qq_MS("file", {"file": content, "name": filename})
+
+    async def stream_attachment(
+        self, attachment: Attachment, bot: dc_Bot
+    ) -> bytes | Path | None:
+        """视频与文件可能很大，流式下载，大文件写入临时文件"""
+        try:
+            content = await stream_file(bot, attachment.url, discord_proxy)
+        except DownloadTooLarge as e:
+            logger.warning(f"stream attachment: {e}")
+            return None
+        if isinstance(content, Path):
+            self.spooled.append(content)
+        return content
 
     async def handle_sticker(self, sticker: StickerItem) -> qq_MS | None:
         return qq_MS.text(f"[{sticker.name}]")
         # WIP
 
-    async def handle_referenced_message(self, referenced: MessageGet) -> qq_MS | None:
-        async with get_session() as session:
-            if reply_id := await session.scalar(
-                select(MsgID.qqid).filter(MsgID.dcid == referenced.id).limit(1)
-            ):
-                return qq_MS.reply(reply_id)
+    async def handle_referenced_message(
+        self, referenced: MessageGet, event: GuildMessageCreateEvent
+    ) -> qq_MS | None:
+        if reply_ids := await get_qqids(referenced.id, dc_channel_id=event.channel_id):
+            return qq_MS.reply(reply_ids[0])
 
     def handle_message_snapshots(
         self,
@@ -388,13 +467,8 @@ class MessageBuilder:
     async def build_snapshots_info(
         self, bot: dc_Bot, guild_id: int, timestamp: datetime
     ) -> qq_MS:
-        try:
-            guild_name = (await bot.get_guild_preview(guild_id=guild_id)).name + " "
-        except ActionFailed as e:
-            if e.message == "Unknown Guild":
-                guild_name = ""
-            else:
-                raise e
+        guild_name = await get_dc_guild_name(bot, guild_id)
+        guild_name = guild_name + " " if guild_name else ""
 
         return qq_MS.text(
             "\n"
@@ -0,0 +1,100 @@
+from typing import get_args
+
+from nonebot.adapters.discord import (
+    ChannelCreateEvent,
+    ChannelDeleteEvent,
+    ChannelUpdateEvent,
+    GuildCreateEvent,
+    GuildRoleCreateEvent,
+    GuildRoleDeleteEvent,
+    GuildRoleUpdateEvent,
+    GuildUpdateEvent,
+)
+from nonebot.adapters.discord.api import Channel, Role, is_not_unset
+
+GuildMetaEvent = (
+    GuildCreateEvent
+    | GuildUpdateEvent
+    | GuildRoleCreateEvent
+    | GuildRoleUpdateEvent
+    | GuildRoleDeleteEvent
+    | ChannelCreateEvent
+    | ChannelUpdateEvent
+    | ChannelDeleteEvent
+)
+GUILD_META_EVENTS = get_args(GuildMetaEvent)
+
+
+class GuildStore:
+    """Discord 服务器元数据：服务器名、身份组名与频道名
+
+    由 GUILD_CREATE 载入，身份组、频道的创建/更新/删除事件保持同步；
+    未命中时由调用方通过 REST 查询后写入
+    """
+
+    _guilds: dict[int, str]
+    _roles: dict[int, dict[int, str]]
+    _channels: dict[int, str]
+
+    __slots__ = ("_channels", "_guilds", "_roles")
+
+    def __init__(self):
+        self._guilds = {}
+        self._roles = {}
+        self._channels = {}
+
+    def guild_name(self, guild_id: int) -> str | None:
+        return self._guilds.get(guild_id)
+
+    def role_name(self, guild_id: int, role_id: int) -> str | None:
+        return self._roles.get(guild_id, {}).get(role_id)
+
+    def channel_name(self, channel_id: int) -> str | None:
+        return self._channels.get(channel_id)
+
+    def set_guild_name(self, guild_id: int, name: str) -> None:
+        self._guilds[guild_id] = name
+
+    def set_role(self, guild_id: int, role: Role) -> None:
+        self._roles.setdefault(guild_id, {})[role.id] = role.name
+
+    def set_channel(self, channel: Channel) -> None:
+        if isinstance(channel.name, str):
+            self._channels[channel.id] = channel.name
+
+    def handle(self, event: GuildMetaEvent) -> None:
+        if isinstance(event, GuildCreateEvent):
+            if is_not_unset(event.name):
+                self._guilds[event.id] = event.name
+            if is_not_unset(event.roles):
+                self._roles[event.id] = {role.id: role.name for role in event.roles}
+            for channel in (
+                *(event.channels if is_not_unset(event.channels) else ()),
+                *(event.threads if is_not_unset(event.threads) else ()),
+            ):
+                self.set_channel(channel)
+        elif isinstance(event, GuildUpdateEvent):
+            self._guilds[event.id] = event.name
+        elif isinstance(event, GuildRoleCreateEvent | GuildRoleUpdateEvent):
+            self.set_role(event.guild_id, event.role)
+        elif isinstance(event, GuildRoleDeleteEvent):
+            self._roles.get(event.guild_id, {}).pop(event.role_id, None)
+        elif isinstance(event, ChannelDeleteEvent):
+            self._channels.pop(event.id, None)
+        else:
+            self.set_channel(event)
+
+    def clear(self) -> None:
+        self._guilds.clear()
+        self._roles.clear()
+        self._channels.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "guilds": len(self._guilds),
+            "roles": sum(len(roles) for roles in self._roles.values()),
+            "channels": len(self._channels),
+        }
+
+
+guild_store = GuildStore()
@@ -0,0 +1,210 @@
+import asyncio
+from hashlib import sha256
+import os
+from pathlib import Path
+import re
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from nonebot_plugin_localstore import get_plugin_cache_dir
+
+from .config import media_cache_attachment_ttl, media_cache_size, media_cache_static_ttl
+
+STATIC = "static"
+"""表情、贴纸等内容不会变化的媒体"""
+ATTACHMENT = "attachment"
+"""图片、附件等链接带签名、会过期的媒体"""
+
+SOURCES: list[tuple[re.Pattern[str], str]] = [
+    (
+        re.compile(
+            r"^(cdn\.discordapp\.com|media\.discordapp\.net)/(emojis|stickers)/"
+        ),
+        STATIC,
+    ),
+    (re.compile(r"^gxh\.vip\.qq\.com/club/item/parcel/"), STATIC),
+    (
+        re.compile(r"^(cdn\.discordapp\.com|media\.discordapp\.net)/attachments/"),
+        ATTACHMENT,
+    ),
+    (re.compile(r"^(multimedia\.nt\.qq\.com\.cn|gchat\.qpic\.cn)/"), ATTACHMENT),
+]
+"""可缓存的来源，按 `host/path` 匹配；其它来源不缓存"""
+
+VOLATILE_PARAMS = frozenset({"ex", "is", "hm", "rkey"})
+"""链接中每次都会变化的签名参数，不参与缓存键"""
+
+
+def normalize_url(url: str) -> tuple[str, str] | None:
+    """返回 (来源类别, 缓存键)，不可缓存时返回 None"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        return None
+    host = (parts.hostname or "").lower()
+    kind = next(
+        (kind for pattern, kind in SOURCES if pattern.match(host + parts.path)), None
+    )
+    if kind is None:
+        return None
+    query = urlencode(
+        sorted(
+            (k, v)
+            for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if k not in VOLATILE_PARAMS
+        )
+    )
+    # 忽略协议，SSL 失败后改用 http 下载的同一文件也能命中
+    return kind, urlunsplit(("https", host, parts.path, query, ""))
+
+
+class MediaCache:
+    """以内容 sha256 寻址的磁盘媒体缓存
+
+    `keys/` 下以规范化链接的 sha256 命名的文件记录内容的 sha256，修改时间即下载时间；
+    `blobs/` 下以内容 sha256 命名的文件保存内容，修改时间即最近使用时间。
+    不同链接的相同内容只保存一份，总大小超过 `max_bytes` 时按最近使用时间淘汰
+    """
+
+    root: Path
+    max_bytes: int
+    ttls: dict[str, float]
+    hits: int
+    misses: int
+    bytes_saved: int
+    _size: int | None
+    _lock: threading.Lock
+
+    __slots__ = (
+        "_lock",
+        "_size",
+        "bytes_saved",
+        "hits",
+        "max_bytes",
+        "misses",
+        "root",
+        "ttls",
+    )
+
+    def __init__(self, root: Path, max_bytes: int, ttls: dict[str, float]):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    async def get(self, url: str) -> bytes | None:
+        if (normalized := normalize_url(url)) is None:
+            return None
+        return await self.load(*normalized)
+
+    async def put(self, url: str, content: bytes) -> None:
+        if (normalized := normalize_url(url)) is not None:
+            await self.store(normalized[1], content)
+
+    async def load(self, kind: str, key: str) -> bytes | None:
+        """按任意键读取，`kind` 决定缓存时间"""
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self._get, kind, key)
+
+    async def store(self, key: str, content: bytes) -> None:
+        if self.enabled:
+            await asyncio.to_thread(self._put, key, content)
+
+    def stats(self) -> dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": self._size or 0,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def _key_path(self, key: str) -> Path:
+        name = sha256(key.encode()).hexdigest()
+        return self.root / "keys" / name[:2] / name
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.root / "blobs" / digest[:2] / digest
+
+    def _get(self, kind: str, key: str) -> bytes | None:
+        key_path = self._key_path(key)
+        try:
+            if time.time() - key_path.stat().st_mtime > self.ttls[kind]:
+                key_path.unlink(missing_ok=True)
+                raise FileNotFoundError
+            blob_path = self._blob_path(key_path.read_text())
+            content = blob_path.read_bytes()
+            os.utime(blob_path)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_saved += len(content)
+        return content
+
+    def _put(self, key: str, content: bytes) -> None:
+        digest = sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._blobs())
+            if blob_path.exists():
+                os.utime(blob_path)
+            else:
+                write_atomic(blob_path, content)
+                self._size += len(content)
+            write_atomic(self._key_path(key), digest.encode())
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _blobs(self) -> list[tuple[float, int, Path]]:
+        blobs = []
+        for path in (self.root / "blobs").glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, path))
+        return blobs
+
+    def _evict(self) -> None:
+        # 指向已淘汰内容的键在下次读取时视为未命中并被覆盖
+        blobs = sorted(self._blobs())
+        self._size = sum(size for _, size, _ in blobs)
+        for _, size, path in blobs:
+            if self._size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+        expire = time.time() - max(self.ttls.values())
+        for path in (self.root / "keys").glob("*/*"):
+            try:
+                if path.stat().st_mtime < expire:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+
+
+def write_atomic(path: Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{threading.get_ident()}")
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+media_cache = MediaCache(
+    get_plugin_cache_dir() / "media",
+    media_cache_size * 1024 * 1024,
+    {STATIC: media_cache_static_ttl, ATTACHMENT: media_cache_attachment_ttl},
+)
@@ -1,9 +1,18 @@
 from nonebot_plugin_orm import Model
-from sqlalchemy import BigInteger
+from sqlalchemy import BigInteger, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 
 
 class MsgID(Model):
+    __table_args__ = (
+        Index("ix_nonebot_plugin_dcqq_relay_msgid_qq_scope", "qq_group_id", "qqid"),
+        Index("ix_nonebot_plugin_dcqq_relay_msgid_dc_scope", "dc_channel_id", "dcid"),
+        UniqueConstraint("qq_group_id", "qqid", "dcid"),
+    )
+
     id: Mapped[int] = mapped_column(primary_key=True)
-    dcid: Mapped[int] = mapped_column(type_=BigInteger())
-    qqid: Mapped[int]
+    dcid: Mapped[int] = mapped_column(type_=BigInteger(), index=True)
+    qqid: Mapped[int] = mapped_column(index=True)
+    qq_group_id: Mapped[int | None] = mapped_column(type_=BigInteger())
+    dc_channel_id: Mapped[int | None] = mapped_column(type_=BigInteger())
+    qq_bot_id: Mapped[int | None] = mapped_column(type_=BigInteger())
@@ -1,13 +1,13 @@
 import asyncio
-from collections.abc import Callable, Coroutine
+from collections.abc import Callable, Coroutine, Sequence
+from contextlib import suppress
 import re
 from typing import Any
 from urllib.request import url2pathname
 
 from anyio import Path
 import filetype
-from nonebot import get_bots, logger
-from nonebot.adapters.discord import Bot as dc_Bot
+from nonebot import logger
 from nonebot.adapters.discord.api import Embed, EmbedAuthor, File
 from nonebot.adapters.discord.exception import NetworkError
 from nonebot.adapters.onebot.v11 import (
@@ -18,21 +18,28 @@ from nonebot.adapters.onebot.v11 import (
     MessageSegment,
 )
 from nonebot.adapters.onebot.v11.event import Reply
-from nonebot_plugin_orm import get_session
-from sqlalchemy import select
 
-from .config import Link, LinkWithWebhook, discord_proxy
-from .model import MsgID
+from .cache import DeleteEcho
+from .config import Link, LinkWithWebhook, discord_proxy, record_wait_timeout
 from .qq_emoji_dict import qq_emoji_dict
-from .utils import get_file_bytes, skil_to_ogg
-
-
-async def get_qq_member_name(bot: qq_Bot, group_id: int, user_id: int) -> str:
-    return (
-        await bot.get_group_member_info(
-            group_id=group_id, user_id=user_id, no_cache=True
-        )
-    )["nickname"]
+from .ratelimit import webhook_sender
+from .store import (
+    Scope,
+    delete_by_dcid,
+    delete_by_qqid,
+    get_dcids,
+    get_qqids,
+    save_msgids,
+)
+from .transcode import TranscodeError, TranscodeTimeout, to_ogg
+from .utils import (
+    DownloadTooLarge,
+    dc_bots,
+    get_file_bytes,
+    get_qq_member_name,
+    stream_file,
+)
+from .watch import wait_for_file
 
 
 def get_file_name(seg: str | MessageSegment, content: bytes | None = None) -> str:
@@ -54,23 +61,76 @@ def get_file_name(seg: str | MessageSegment, content: bytes | None = None) -> st
     return file
 
 
+class PendingText:
+    """同一发送者在合并窗口内连续发送的纯文本消息，合并为一条 Discord 消息"""
+
+    bot: qq_Bot
+    link: LinkWithWebhook
+    events: list[GroupMessageEvent]
+    length: int
+    closed: asyncio.Event
+    done: asyncio.Future[None]
+    sent: asyncio.Future[None] | None
+
+    __slots__ = ("bot", "closed", "done", "events", "length", "link", "sent")
+
+    def __init__(self, bot: qq_Bot, event: GroupMessageEvent, link: LinkWithWebhook):
+        self.bot = bot
+        self.link = link
+        self.events = [event]
+        self.length = len(event.get_message().extract_plain_text())
+        self.closed = asyncio.Event()
+        self.done = asyncio.get_running_loop().create_future()
+        self.sent = None
+
+    @staticmethod
+    def is_text_only(event: GroupMessageEvent) -> bool:
+        message = event.get_message()
+        return (
+            event.reply is None
+            and bool(message)
+            and all(seg.type == "text" for seg in message)
+        )
+
+    def add(self, event: GroupMessageEvent, max_length: int) -> bool:
+        """消息能合并时加入并返回 True"""
+        length = self.length + 1 + len(event.get_message().extract_plain_text())
+        if (
+            self.closed.is_set()
+            or event.user_id != self.events[0].user_id
+            or length > max_length
+        ):
+            return False
+        self.events.append(event)
+        self.length = length
+        return True
+
+    async def wait(self, window: float) -> None:
+        """等待合并窗口结束或被提前关闭"""
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.closed.wait(), window)
+        self.closed.set()
+
+
 async def create_qq_to_dc(
     bot: qq_Bot,
     event: GroupMessageEvent,
     link: LinkWithWebhook,
+    merged: Sequence[GroupMessageEvent] = (),
 ):
-    """QQ 消息转发到 discord"""
+    """QQ 消息转发到 discord
+
+    `merged` 为同一发送者紧随其后的纯文本消息，逐行追加到同一条消息中
+    """
     logger.debug("create qq to dc: start")
-    dc_bot: dc_Bot = next(
-        bot
-        for self_id, bot in get_bots().items()
-        if isinstance(bot, dc_Bot)
-        and ((self_id == link.dc_bot_id) if link.dc_bot_id else True)
-    )
+    dc_bot = dc_bots.resolve(link)
     builder = MessageBuilder()
 
     seg_msg = event.get_message()
     text, files, embeds = await builder.build(seg_msg, bot, event)
+    for follow in merged:
+        follow_text, _, _ = await builder.build(follow.get_message(), bot, follow)
+        text = "\n".join(part for part in (text, follow_text) if part)
 
     if reply := event.reply:
         embeds = [await builder.handle_reply(reply, bot, link), *embeds]
@@ -82,7 +142,8 @@ async def create_qq_to_dc(
 
     for try_times in range(3):
         try:
-            send = await dc_bot.execute_webhook(
+            send = await webhook_sender.execute(
+                dc_bot,
                 webhook_id=link.webhook_id,
                 token=link.webhook_token,
                 content=text,
@@ -102,9 +163,11 @@ async def create_qq_to_dc(
         logger.error("create qq to dc: failed")
         return
 
-    async with get_session() as session:
-        session.add(MsgID(dcid=send.id, qqid=event.message_id))
-        await session.commit()
+    logger.debug(f"webhook sender: {webhook_sender.stats()}")
+    await save_msgids(
+        Scope.of(link, bot.self_id),
+        [(send.id, e.message_id) for e in (event, *merged)],
+    )
 
     logger.debug("create qq to dc: done")
 
@@ -112,31 +175,30 @@ async def create_qq_to_dc(
 async def delete_qq_to_dc(
     event: GroupRecallNoticeEvent,
     link: Link,
-    just_delete: list,
+    just_delete: DeleteEcho,
 ):
     logger.debug("delete qq to dc: start")
-    if (id := event.message_id) in just_delete:
-        just_delete.remove(id)
+    if just_delete.qq.pop(event.message_id):
         return
-    dc_bot: dc_Bot = next(
-        bot
-        for self_id, bot in get_bots().items()
-        if isinstance(bot, dc_Bot)
-        and ((self_id == link.dc_bot_id) if link.dc_bot_id else True)
-    )
+    scope = Scope.of(link, event.self_id)
+    dc_bot = dc_bots.resolve(link)
     for try_times in range(3):
         try:
-            async with get_session() as session:
-                if msgids := await session.scalars(
-                    select(MsgID).filter(MsgID.qqid == event.message_id)
-                ):
-                    for msgid in msgids:
-                        await dc_bot.delete_message(
-                            message_id=msgid.dcid, channel_id=link.dc_channel_id
-                        )
-                        just_delete.append(msgid.dcid)
-                        await session.delete(msgid)
-                    await session.commit()
+            if dcids := await get_dcids(
+                event.message_id,
+                qq_group_id=scope.qq_group_id,
+                qq_bot_id=scope.qq_bot_id,
+            ):
+                for dcid in dcids:
+                    await dc_bot.delete_message(
+                        message_id=dcid, channel_id=link.dc_channel_id
+                    )
+                    just_delete.dc.add(dcid)
+                    # 合并发送的消息被整条删除，同一条中其它 QQ 消息的映射一并删除
+                    qqids = await get_qqids(dcid, dc_channel_id=link.dc_channel_id)
+                    if len(qqids) > 1:
+                        await delete_by_dcid(scope, dcid, qqids)
+                await delete_by_qqid(scope, event.message_id, dcids)
             logger.debug("delete qq to dc: done")
             break
         except (UnboundLocalError, TypeError, NameError) as e:
@@ -261,11 +323,10 @@ class MessageBuilder:
                 icon_url=f"https://q.qlogo.cn/g?b=qq&nk={sender.user_id}&s=100",
             )
 
-        async with get_session() as session:
-            reference_id = await session.scalar(
-                select(MsgID.dcid).filter(MsgID.qqid == reply.message_id).limit(1)
-            )
-        if reference_id:
+        if reference_ids := await get_dcids(
+            reply.message_id, qq_group_id=link.qq_group_id, qq_bot_id=int(bot.self_id)
+        ):
+            reference_id = reference_ids[0]
             description = (
                 f"{plaintext_msg}\n\n"
                 + timestamp
@@ -279,6 +340,15 @@ class MessageBuilder:
             description=description,
         )
 
+    async def stream(self, bot: qq_Bot, url: str) -> bytes | None:
+        """流式下载视频与文件，超过大小上限时返回 None"""
+        try:
+            content = await stream_file(bot, url, spool=False)
+        except DownloadTooLarge as e:
+            logger.warning(f"stream file: {e}")
+            return None
+        return content if isinstance(content, bytes) else None
+
     async def text(
         self, seg: MessageSegment, bot: qq_Bot, event: GroupMessageEvent
     ) -> MsgResult:
@@ -368,12 +438,11 @@ class MessageBuilder:
     ) -> MsgResult:
         record_bytes: bytes | None = None
 
-        if path := seg.data.get("path", ""):
-            for _ in range(3):
-                if await Path(path).exists():
-                    record_bytes = await Path(path).read_bytes()
-                    break
-                await asyncio.sleep(0.1)
+        # 语音通常很小，只短暂等待，避免阻塞同一链接后面的消息
+        if (path := seg.data.get("path", "")) and await wait_for_file(
+            path, record_wait_timeout
+        ):
+            record_bytes = await Path(path).read_bytes()
         if not record_bytes and (url := seg.data.get("url", "")):
             record_bytes = await get_file_bytes(bot, url)
         if not record_bytes and (file_val := seg.data.get("file", "")):
@@ -381,17 +450,21 @@ class MessageBuilder:
             if await Path(path).exists():
                 record_bytes = await Path(path).read_bytes()
 
+        ogg_bytes: bytes | None = None
+        if record_bytes:
+            try:
+                ogg_bytes = await to_ogg(record_bytes)
+            except (TranscodeTimeout, TranscodeError) as e:
+                logger.warning(f"convert record: {e}")
+
         return MsgResult(
             text="[语音]",
             file=(
-                File(
-                    content=skil_to_ogg(record_bytes),
-                    filename="voice-message.ogg",
-                )
-                if record_bytes
+                File(content=ogg_bytes, filename="voice-message.ogg")
+                if ogg_bytes
                 else None
             ),
-            ensure=not record_bytes,
+            ensure=not ogg_bytes,
         )
 
     async def video(
@@ -401,14 +474,10 @@ class MessageBuilder:
         url: str = seg.data["url"]
         content: bytes | None = None
 
-        if s_path := seg.data.get("path", ""):
-            for _ in range(10):
-                if await Path(s_path).exists():
-                    content = await Path(s_path).read_bytes()
-                    break
-                await asyncio.sleep(1)
+        if (s_path := seg.data.get("path", "")) and await wait_for_file(s_path):
+            content = await Path(s_path).read_bytes()
         if not content and re.search(r"^https?:\/\/", url):
-            content = await get_file_bytes(bot, url)
+            content = await self.stream(bot, url)
         if not content and (path := Path(url)) and await path.is_file():
             content = await path.read_bytes()
         if not content:
@@ -427,11 +496,13 @@ class MessageBuilder:
         filename = get_file_name(seg)
 
         if re.search(r"^https?:\/\/", seg.data.get("url", "")):
-            content = await get_file_bytes(bot, seg.data["url"])
+            content = await self.stream(bot, seg.data["url"])
         elif file_id := seg.data.get("file_id", ""):
             file_info = await bot.call_api("get_file", file_id=file_id)
             content = await Path(file_info["file"]).read_bytes()
         else:
+            content = None
+        if not content:
             return MsgResult(ensure=True, text=f"[{filename}]")
 
         return MsgResult(
@@ -0,0 +1,200 @@
+import asyncio
+from collections import deque
+from time import monotonic
+from typing import Any
+
+from nonebot import logger
+from nonebot.adapters.discord import Bot as dc_Bot
+from nonebot.adapters.discord.api import MessageGet
+from nonebot.adapters.discord.exception import RateLimitException
+
+from .config import (
+    global_rate_limit,
+    webhook_rate_limit,
+    webhook_rate_period,
+    webhook_rate_retries,
+)
+
+
+class Bucket:
+    """速率限制桶：任意 `period` 秒内最多 `limit` 次请求
+
+    记录最近 `limit` 次请求的时间，被 429 时在 `blocked_until` 之前不再发送。
+    `limit` 不大于 0 时不限制请求数，只在被 429 时暂停
+    """
+
+    limit: int
+    period: float
+    blocked_until: float
+    _sent: deque[float]
+
+    __slots__ = ("_sent", "blocked_until", "limit", "period")
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self.blocked_until = 0.0
+        self._sent = deque(maxlen=max(limit, 0))
+
+    def delay(self, now: float) -> float:
+        """距离可以发送下一次请求的秒数"""
+        delay = self.blocked_until - now
+        if self.limit > 0 and len(self._sent) == self.limit:
+            delay = max(delay, self._sent[0] + self.period - now)
+        return max(delay, 0.0)
+
+    def acquire(self, now: float) -> None:
+        self._sent.append(now)
+
+    def block(self, until: float) -> None:
+        self.blocked_until = max(self.blocked_until, until)
+
+    def stats(self, now: float) -> dict[str, float]:
+        recent = sum(1 for sent in self._sent if now - sent < self.period)
+        return {
+            "limit": self.limit,
+            "remaining": self.limit - recent,
+            "reset_after": self.delay(now),
+        }
+
+
+class WebhookSender:
+    """按 Discord 速率限制执行 webhook
+
+    每个 webhook 一个桶，每个机器人一个全局桶。同一 webhook 的请求按顺序排队，
+    在两个桶都有余量时才发出；被 429 时暂停该桶，按指数退避后重试。
+    适配器不提供响应头与 retry_after，因此桶的容量按 Discord 文档中的限制配置
+    """
+
+    webhook_limit: int
+    webhook_period: float
+    global_limit: int
+    retries: int
+    rate_limited: int
+    requests: int
+    sent: int
+    waiting: int
+    total_wait: float
+    max_wait: float
+    _buckets: dict[int, Bucket]
+    _globals: dict[str, Bucket]
+    _queues: dict[int, asyncio.Lock]
+
+    __slots__ = (
+        "_buckets",
+        "_globals",
+        "_queues",
+        "global_limit",
+        "max_wait",
+        "rate_limited",
+        "requests",
+        "retries",
+        "sent",
+        "total_wait",
+        "waiting",
+        "webhook_limit",
+        "webhook_period",
+    )
+
+    def __init__(
+        self,
+        webhook_limit: int,
+        webhook_period: float,
+        global_limit: int,
+        retries: int,
+    ):
+        self.webhook_limit = webhook_limit
+        self.webhook_period = webhook_period
+        self.global_limit = global_limit
+        self.retries = retries
+        self.rate_limited = 0
+        self.requests = 0
+        self.sent = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._buckets = {}
+        self._globals = {}
+        self._queues = {}
+
+    async def execute(
+        self, bot: dc_Bot, webhook_id: int, token: str, **data: Any
+    ) -> MessageGet:
+        bucket = self._buckets.get(webhook_id)
+        if bucket is None:
+            bucket = self._buckets[webhook_id] = Bucket(
+                self.webhook_limit, self.webhook_period
+            )
+        global_bucket = self._globals.get(bot.self_id)
+        if global_bucket is None:
+            global_bucket = self._globals[bot.self_id] = Bucket(self.global_limit, 1)
+        queue = self._queues.setdefault(webhook_id, asyncio.Lock())
+
+        start = monotonic()
+        self.waiting += 1
+        try:
+            async with queue:
+                await self._wait(bucket, global_bucket)
+                self._record_wait(monotonic() - start)
+                attempt = 0
+                while True:
+                    try:
+                        result = await bot.execute_webhook(
+                            webhook_id=webhook_id, token=token, **data
+                        )
+                    except RateLimitException:
+                        self.rate_limited += 1
+                        if attempt >= self.retries:
+                            raise
+                        backoff = self.webhook_period * 2**attempt
+                        attempt += 1
+                        logger.warning(
+                            f"webhook {webhook_id} rate limited, "
+                            f"retry in {backoff:.1f}s ({attempt}/{self.retries})"
+                        )
+                        bucket.block(monotonic() + backoff)
+                        await self._wait(bucket, global_bucket)
+                    else:
+                        self.sent += 1
+                        return result
+        finally:
+            self.waiting -= 1
+
+    async def _wait(self, bucket: Bucket, global_bucket: Bucket) -> None:
+        # 睡到两个桶都有余量为止，醒来后重新检查（全局桶可能已被其它 webhook 用掉）
+        while True:
+            now = monotonic()
+            delay = max(bucket.delay(now), global_bucket.delay(now))
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        bucket.acquire(now)
+        global_bucket.acquire(now)
+
+    def _record_wait(self, wait: float) -> None:
+        self.requests += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> dict[str, Any]:
+        now = monotonic()
+        return {
+            "requests": self.requests,
+            "sent": self.sent,
+            "waiting": self.waiting,
+            "rate_limited": self.rate_limited,
+            "avg_wait": self.total_wait / self.requests if self.requests else 0.0,
+            "max_wait": self.max_wait,
+            "webhooks": {
+                webhook_id: bucket.stats(now)
+                for webhook_id, bucket in self._buckets.items()
+            },
+            "global": {
+                bot_id: bucket.stats(now) for bot_id, bucket in self._globals.items()
+            },
+        }
+
+
+webhook_sender = WebhookSender(
+    webhook_rate_limit, webhook_rate_period, global_rate_limit, webhook_rate_retries
+)
@@ -0,0 +1,170 @@
+from collections.abc import Iterable
+from typing import Generic, TypeVar
+
+from nonebot import get_bots
+from nonebot.adapters import Bot
+
+from .config import Link, LinkWithoutWebhook, LinkWithWebhook
+
+AnyLink = LinkWithoutWebhook | LinkWithWebhook
+B = TypeVar("B", bound=Bot)
+
+
+class LinkIndex:
+    """频道链接路由索引
+
+    链接集合变化时调用 `rebuild` 整体重建，查询均为 O(1)
+    """
+
+    by_qq_group: dict[int, AnyLink]
+    by_dc_channel: dict[tuple[int, int], AnyLink]
+    webhook_ids: frozenset[int]
+
+    __slots__ = ("by_dc_channel", "by_qq_group", "webhook_ids")
+
+    def __init__(
+        self,
+        channel_links: Iterable[AnyLink] = (),
+        webhook_links: Iterable[LinkWithWebhook] = (),
+    ):
+        self.rebuild(channel_links, webhook_links)
+
+    def rebuild(
+        self,
+        channel_links: Iterable[AnyLink],
+        webhook_links: Iterable[LinkWithWebhook],
+    ) -> None:
+        by_qq_group: dict[int, AnyLink] = {}
+        by_dc_channel: dict[tuple[int, int], AnyLink] = {}
+        webhook_ids: set[int] = set()
+
+        # 已获取到 webhook 的链接优先，同一群/频道重复配置时以先出现的为准
+        for link in webhook_links:
+            by_qq_group.setdefault(link.qq_group_id, link)
+            by_dc_channel.setdefault((link.dc_guild_id, link.dc_channel_id), link)
+            webhook_ids.add(link.webhook_id)
+        for link in channel_links:
+            by_qq_group.setdefault(link.qq_group_id, link)
+            by_dc_channel.setdefault((link.dc_guild_id, link.dc_channel_id), link)
+
+        # 整体替换，保证并发读取时看到的总是完整的一份索引
+        self.by_qq_group, self.by_dc_channel, self.webhook_ids = (
+            by_qq_group,
+            by_dc_channel,
+            frozenset(webhook_ids),
+        )
+
+    def get_qq(self, group_id: int) -> AnyLink | None:
+        return self.by_qq_group.get(group_id)
+
+    def get_dc(self, guild_id: int, channel_id: int) -> AnyLink | None:
+        return self.by_dc_channel.get((guild_id, channel_id))
+
+    def is_own_webhook(self, webhook_id: object) -> bool:
+        return webhook_id in self.webhook_ids
+
+
+class WebhookRegistry:
+    """已获取到 webhook 的链接登记表，以 Discord 频道为键
+
+    重连时先用 `lookup` 找出已知的链接，只为缺失的频道请求 webhook，
+    再用 `refresh` 整体替换登记表，重复连接不会产生重复条目
+    """
+
+    hits: int
+    misses: int
+    _links: dict[tuple[int, int], LinkWithWebhook]
+
+    __slots__ = ("_links", "hits", "misses")
+
+    def __init__(self):
+        self._links = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._links)
+
+    def lookup(self, link: AnyLink) -> LinkWithWebhook | None:
+        """查找与配置一致的已知链接"""
+        known = self._links.get((link.dc_guild_id, link.dc_channel_id))
+        if known is not None and all(
+            getattr(known, field) == value
+            for field, value in link
+            if field not in ("webhook_id", "webhook_token") or value is not None
+        ):
+            self.hits += 1
+            return known
+        self.misses += 1
+        return None
+
+    def refresh(self, links: Iterable[LinkWithWebhook]) -> None:
+        """以新的链接集合整体替换登记表"""
+        registry: dict[tuple[int, int], LinkWithWebhook] = {}
+        for link in links:
+            registry.setdefault((link.dc_guild_id, link.dc_channel_id), link)
+        self._links = registry
+
+    def links(self) -> list[LinkWithWebhook]:
+        return list(self._links.values())
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._links), "hits": self.hits, "misses": self.misses}
+
+
+class BotNotConnected(Exception):
+    """链接对应的机器人未连接"""
+
+
+class BotResolver(Generic[B]):
+    """某一类机器人的连接表，由 `on_bot_connect` / `on_bot_disconnect` 维护
+
+    链接指定了机器人时按 `self_id` 查找，否则使用最早连接的机器人，
+    查询均为 O(1)；表中没有时回退扫描一次 `get_bots()`，仍找不到则抛出
+    `BotNotConnected`
+    """
+
+    bot_type: type[B]
+    field: str
+    _bots: dict[str, B]
+
+    __slots__ = ("_bots", "bot_type", "field")
+
+    def __init__(self, bot_type: type[B], field: str):
+        self.bot_type = bot_type
+        self.field = field
+        self._bots = {}
+
+    def __len__(self) -> int:
+        return len(self._bots)
+
+    def connect(self, bot: Bot) -> None:
+        if isinstance(bot, self.bot_type):
+            self._bots.setdefault(bot.self_id, bot)
+
+    def disconnect(self, bot: Bot) -> None:
+        if self._bots.get(bot.self_id) is bot:
+            del self._bots[bot.self_id]
+
+    def resolve(self, link: Link) -> B:
+        self_id: str | None = getattr(link, self.field)
+        bot = self._get(self_id)
+        if bot is None:
+            # 插件加载前已连接的机器人不会触发连接事件
+            for connected in get_bots().values():
+                self.connect(connected)
+            bot = self._get(self_id)
+        if bot is None:
+            raise BotNotConnected(f"no connected bot for {self.field}={self_id}")
+        return bot
+
+    def _get(self, self_id: str | None) -> B | None:
+        if self_id is not None:
+            bot = self._bots.get(self_id)
+        else:
+            bot = next(iter(self._bots.values()), None)
+        # 连接表与驱动器不一致时（如断开事件丢失）丢弃旧记录
+        if bot is not None and get_bots().get(bot.self_id) is not bot:
+            del self._bots[bot.self_id]
+            return None
+        return bot
@@ -0,0 +1,110 @@
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable, Hashable
+from time import monotonic
+from typing import Any, Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+
+class _Job:
+    func: Callable[[], Awaitable[Any]]
+    future: asyncio.Future[Any]
+    enqueued: float
+
+    __slots__ = ("enqueued", "func", "future")
+
+    def __init__(self, func: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.func = func
+        self.future = future
+        self.enqueued = monotonic()
+
+
+class _Lane:
+    jobs: deque[_Job]
+    worker: asyncio.Task[None] | None
+
+    __slots__ = ("jobs", "worker")
+
+    def __init__(self):
+        self.jobs = deque()
+        self.worker = None
+
+
+class Sequencer(Generic[K]):
+    """每个键一条队列，同一键的任务按提交顺序逐个执行，不同键之间并行
+
+    队列为空时工作协程退出，下次提交时重新创建。调用方被取消时只撤回
+    尚未开始的任务，已开始的任务继续执行完
+    """
+
+    completed: int
+    total_wait: float
+    max_wait: float
+    _lanes: dict[K, _Lane]
+
+    __slots__ = ("_lanes", "completed", "max_wait", "total_wait")
+
+    def __init__(self):
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lanes = {}
+
+    async def run(self, key: K, func: Callable[[], Awaitable[T]]) -> T:
+        return await self.submit(key, func)
+
+    def submit(self, key: K, func: Callable[[], Awaitable[T]]) -> asyncio.Future[T]:
+        """立即排队并返回结果 future，取消 future 即撤回尚未开始的任务"""
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        future = asyncio.get_running_loop().create_future()
+        lane.jobs.append(_Job(func, future))
+        if lane.worker is None or lane.worker.done():
+            lane.worker = asyncio.create_task(self._work(key, lane))
+        return future
+
+    async def _work(self, key: K, lane: _Lane) -> None:
+        try:
+            while lane.jobs:
+                job = lane.jobs[0]
+                if not job.future.done():
+                    self._record_wait(monotonic() - job.enqueued)
+                    try:
+                        result = await job.func()
+                    except Exception as e:
+                        if not job.future.done():
+                            job.future.set_exception(e)
+                    else:
+                        if not job.future.done():
+                            job.future.set_result(result)
+                    self.completed += 1
+                lane.jobs.popleft()
+        finally:
+            # 工作协程被取消时，剩下的任务一并取消
+            for job in lane.jobs:
+                job.future.cancel()
+            lane.jobs.clear()
+            if self._lanes.get(key) is lane:
+                del self._lanes[key]
+
+    def _record_wait(self, wait: float) -> None:
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> dict[str, Any]:
+        now = monotonic()
+        return {
+            "lanes": len(self._lanes),
+            "depth": {key: len(lane.jobs) for key, lane in self._lanes.items()},
+            "head_wait": {
+                key: now - lane.jobs[0].enqueued
+                for key, lane in self._lanes.items()
+                if lane.jobs
+            },
+            "completed": self.completed,
+            "avg_wait": self.total_wait / self.completed if self.completed else 0.0,
+            "max_wait": self.max_wait,
+        }
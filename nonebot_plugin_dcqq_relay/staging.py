@@ -0,0 +1,138 @@
+import asyncio
+from collections import Counter
+from collections.abc import Iterable
+from hashlib import sha256
+import os
+from pathlib import Path
+import time
+
+from nonebot import logger
+from nonebot_plugin_localstore import get_plugin_cache_dir
+
+from .config import upload_cache_size, upload_cache_ttl
+from .media import write_atomic
+from .utils import STREAM_CHUNK_SIZE, spool_dir
+
+GRACE_PERIOD = 60
+"""刚写入的文件可能还没有被引用，这段时间（秒）内不清理"""
+
+
+class StagingDir:
+    """暂存发给 OneBot 实现的文件
+
+    文件以内容的 sha256 命名，相同内容只写入一次。发送中的文件被引用计数，
+    定期清理时跳过；其余文件超过 `max_age` 秒未使用时删除，
+    总大小超过 `max_bytes` 时按最近使用时间（mtime）从旧到新删除
+    """
+
+    root: Path
+    max_bytes: int
+    max_age: float
+    _pins: Counter[Path]
+
+    __slots__ = ("_pins", "max_age", "max_bytes", "root")
+
+    def __init__(self, root: Path, max_bytes: int, max_age: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._pins = Counter()
+
+    async def save(
+        self, file: bytes | Path, file_name: str, default_suffix: str = ""
+    ) -> Path:
+        """在线程中写入文件，返回的路径在调用 `release` 前不会被清理
+
+        文件名没有扩展名时使用 `default_suffix`
+        """
+        suffix = Path(file_name).suffix.lower() or default_suffix
+        path = await asyncio.to_thread(self._save, file, suffix)
+        self._pins[path] += 1
+        return path
+
+    def release(self, paths: Iterable[Path]) -> None:
+        for path in paths:
+            self._pins[path] -= 1
+            if self._pins[path] <= 0:
+                del self._pins[path]
+
+    def is_pinned(self, path: Path) -> bool:
+        return path in self._pins
+
+    async def cleanup(self) -> tuple[int, int]:
+        """清理过期和超出容量的文件，返回 (删除的文件数, 释放的字节数)"""
+        return await asyncio.to_thread(self._cleanup, frozenset(self._pins))
+
+    async def cleanup_forever(self, interval: float) -> None:
+        while True:
+            try:
+                removed, freed = await self.cleanup()
+                if removed:
+                    logger.info(f"upload cache: removed {removed} files ({freed} B)")
+            except Exception as e:
+                logger.error(f"upload cache cleanup error: {e}")
+            await asyncio.sleep(interval)
+
+    def _save(self, file: bytes | Path, suffix: str) -> Path:
+        digest = (
+            sha256(file).hexdigest() if isinstance(file, bytes) else _file_sha256(file)
+        )
+        path = self.root / (digest + suffix)
+        if path.is_file():
+            # 已有相同内容，只更新最近使用时间
+            os.utime(path)
+            if isinstance(file, Path):
+                file.unlink(missing_ok=True)
+        elif isinstance(file, Path):
+            self.root.mkdir(parents=True, exist_ok=True)
+            file.replace(path)
+        else:
+            write_atomic(path, file)
+        return path
+
+    def _cleanup(self, pinned: frozenset[Path]) -> tuple[int, int]:
+        now = time.time()
+        total = 0
+        files: list[tuple[float, int, Path]] = []
+        for path in self.root.glob("*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            total += stat.st_size
+            if path not in pinned and now - stat.st_mtime > GRACE_PERIOD:
+                files.append((stat.st_mtime, stat.st_size, path))
+        removed = freed = 0
+        for mtime, size, path in sorted(files):
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+
+def _file_sha256(path: Path) -> str:
+    digest = sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(STREAM_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remove_leftovers() -> int:
+    """删除上次运行残留的下载临时文件，以及旧版本直接写在缓存目录下的文件"""
+    removed = 0
+    for path in (*spool_dir.glob("*"), *get_plugin_cache_dir().glob("*")):
+        if path.is_file():
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+upload_staging = StagingDir(
+    get_plugin_cache_dir() / "upload",
+    upload_cache_size * 1024 * 1024,
+    upload_cache_ttl,
+)
@@ -0,0 +1,364 @@
+import asyncio
+from collections.abc import Iterable
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import NamedTuple
+
+from nonebot import logger
+from nonebot_plugin_orm import get_session
+from sqlalchemy import ColumnElement, delete, insert, or_, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .cache import LRUCache
+from .config import (
+    Link,
+    msgid_cache_size,
+    msgid_flush_interval,
+    msgid_flush_rows,
+    msgid_prune_chunk,
+    msgid_prune_interval,
+    msgid_prune_vacuum,
+    msgid_retention_days,
+)
+from .model import MsgID
+
+
+class Scope(NamedTuple):
+    """映射所属的链接与 QQ 机器人"""
+
+    qq_group_id: int
+    dc_channel_id: int
+    qq_bot_id: int | None = None
+
+    @classmethod
+    def of(cls, link: Link, qq_bot_id: int | str | None = None) -> "Scope":
+        return cls(
+            link.qq_group_id,
+            link.dc_channel_id,
+            int(qq_bot_id) if qq_bot_id is not None else None,
+        )
+
+
+QQKey = tuple[int | None, int, int]
+"""(qq_bot_id, qq_group_id, qqid)"""
+DCKey = tuple[int, int]
+"""(dc_channel_id, dcid)"""
+
+qq_to_dc_cache: LRUCache[QQKey, tuple[int, ...]] = LRUCache(msgid_cache_size)
+dc_to_qq_cache: LRUCache[DCKey, tuple[int, ...]] = LRUCache(msgid_cache_size)
+
+
+def _cache_add(cache: LRUCache, key: tuple, value: int) -> None:
+    # 新保存的映射来自刚转发的消息，缓存中没有的键在数据库中也不会有其它行
+    cached = cache.pop(key) or ()
+    cache.set(key, (*cached, value) if value not in cached else cached)
+
+
+def _qq_scope(qq_group_id: int, qq_bot_id: int | None) -> list[ColumnElement[bool]]:
+    # 没有记录群号与机器人的旧数据也参与匹配
+    clauses = [or_(MsgID.qq_group_id == qq_group_id, MsgID.qq_group_id.is_(None))]
+    if qq_bot_id is not None:
+        clauses.append(or_(MsgID.qq_bot_id == qq_bot_id, MsgID.qq_bot_id.is_(None)))
+    return clauses
+
+
+def _dc_scope(dc_channel_id: int) -> ColumnElement[bool]:
+    return or_(MsgID.dc_channel_id == dc_channel_id, MsgID.dc_channel_id.is_(None))
+
+
+def _row(scope: Scope, dcid: int, qqid: int) -> dict[str, int | None]:
+    return {"dcid": dcid, "qqid": qqid, **scope._asdict()}
+
+
+async def _upsert(rows: list[dict[str, int | None]]) -> None:
+    """插入映射，已存在的 (qq_group_id, qqid, dcid) 将被忽略"""
+    async with get_session() as session:
+        dialect = session.get_bind(MsgID).dialect.name
+        if dialect == "sqlite":
+            stmt = sqlite_insert(MsgID).on_conflict_do_nothing()
+        elif dialect == "postgresql":
+            stmt = postgresql_insert(MsgID).on_conflict_do_nothing()
+        elif dialect in ("mysql", "mariadb"):
+            stmt = insert(MsgID).prefix_with("IGNORE")
+        else:
+            stmt = insert(MsgID)
+        await session.execute(stmt, rows)
+        await session.commit()
+
+
+class WriteBehind:
+    """批量写入缓冲区
+
+    映射先进入缓冲区，每隔 `interval` 秒或攒够 `rows` 行时一次性写入数据库
+    """
+
+    interval: float
+    rows: int
+    pending: list[tuple[Scope, int, int]]
+    _lock: asyncio.Lock
+    _timer: asyncio.Task[None] | None
+
+    __slots__ = ("_lock", "_timer", "interval", "pending", "rows")
+
+    def __init__(self, interval: float, rows: int):
+        self.interval = interval
+        self.rows = rows
+        self.pending = []
+        self._lock = asyncio.Lock()
+        self._timer = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    async def add(self, scope: Scope, pairs: list[tuple[int, int]]) -> None:
+        self.pending.extend((scope, dcid, qqid) for dcid, qqid in pairs)
+        if len(self.pending) >= self.rows:
+            try:
+                await self.flush()
+            except Exception as e:
+                # 消息已经发出，写入失败不能让调用方重试发送；行留在缓冲区中由定时器重试
+                logger.error(f"msgid write-behind flush error: {e}")
+            else:
+                return
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    def find_dcids(
+        self, qqid: int, qq_group_id: int, qq_bot_id: int | None
+    ) -> list[int]:
+        return [
+            dcid
+            for scope, dcid, q in self.pending
+            if q == qqid
+            and scope.qq_group_id == qq_group_id
+            and (qq_bot_id is None or scope.qq_bot_id in (qq_bot_id, None))
+        ]
+
+    def find_qqids(self, dcid: int, dc_channel_id: int) -> list[int]:
+        return [
+            qqid
+            for scope, d, qqid in self.pending
+            if d == dcid and scope.dc_channel_id == dc_channel_id
+        ]
+
+    async def discard(
+        self, scope: Scope, *, dcid: int | None = None, qqid: int | None = None
+    ) -> None:
+        """从缓冲区删除映射
+
+        与 `flush` 共用锁：正在写入的批次提交后才返回，之后的数据库删除不会
+        早于这批插入，被删除的映射不会重新出现
+        """
+        async with self._lock:
+            self.pending = [
+                (s, d, q)
+                for s, d, q in self.pending
+                if not (
+                    (
+                        dcid is not None
+                        and d == dcid
+                        and s.dc_channel_id == scope.dc_channel_id
+                    )
+                    or (
+                        qqid is not None
+                        and q == qqid
+                        and s.qq_group_id == scope.qq_group_id
+                    )
+                )
+            ]
+
+    async def flush(self) -> None:
+        async with self._lock:
+            pending, self.pending = self.pending, []
+            if not pending:
+                return
+            try:
+                await _upsert([_row(*row) for row in pending])
+            except Exception:
+                self.pending[:0] = pending
+                raise
+            logger.debug(f"msgid write-behind: flushed {len(pending)} rows")
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"msgid write-behind flush error: {e}")
+            if self._timer is None:
+                self._timer = asyncio.create_task(self._flush_later())
+
+
+write_behind = WriteBehind(msgid_flush_interval / 1000, msgid_flush_rows)
+
+
+async def save_msgids(scope: Scope, pairs: Iterable[tuple[int, int]]) -> None:
+    """保存 (dcid, qqid) 映射，写入数据库（或写入缓冲区）后同步写入缓存"""
+    pairs = list(pairs)
+    if not pairs:
+        return
+    if write_behind.enabled:
+        await write_behind.add(scope, pairs)
+    else:
+        await _upsert([_row(scope, dcid, qqid) for dcid, qqid in pairs])
+    for dcid, qqid in pairs:
+        _cache_add(qq_to_dc_cache, (scope.qq_bot_id, scope.qq_group_id, qqid), dcid)
+        _cache_add(dc_to_qq_cache, (scope.dc_channel_id, dcid), qqid)
+
+
+async def get_dcids(
+    qqid: int, *, qq_group_id: int, qq_bot_id: int | None = None
+) -> tuple[int, ...]:
+    key = (qq_bot_id, qq_group_id, qqid)
+    if (cached := qq_to_dc_cache.get(key)) is not None:
+        return cached
+    async with get_session() as session:
+        dcids = tuple(
+            await session.scalars(
+                select(MsgID.dcid)
+                .filter(MsgID.qqid == qqid, *_qq_scope(qq_group_id, qq_bot_id))
+                .order_by(MsgID.id)
+            )
+        )
+    dcids += tuple(write_behind.find_dcids(qqid, qq_group_id, qq_bot_id))
+    if dcids:
+        qq_to_dc_cache.set(key, dcids)
+    return dcids
+
+
+async def get_qqids(dcid: int, *, dc_channel_id: int) -> tuple[int, ...]:
+    key = (dc_channel_id, dcid)
+    if (cached := dc_to_qq_cache.get(key)) is not None:
+        return cached
+    async with get_session() as session:
+        qqids = tuple(
+            await session.scalars(
+                select(MsgID.qqid)
+                .filter(MsgID.dcid == dcid, _dc_scope(dc_channel_id))
+                .order_by(MsgID.id)
+            )
+        )
+    qqids += tuple(write_behind.find_qqids(dcid, dc_channel_id))
+    if qqids:
+        dc_to_qq_cache.set(key, qqids)
+    return qqids
+
+
+async def delete_by_qqid(scope: Scope, qqid: int, dcids: Iterable[int]) -> None:
+    await write_behind.discard(scope, qqid=qqid)
+    async with get_session() as session:
+        await session.execute(
+            delete(MsgID).filter(
+                MsgID.qqid == qqid, *_qq_scope(scope.qq_group_id, scope.qq_bot_id)
+            )
+        )
+        await session.commit()
+    qq_to_dc_cache.pop((scope.qq_bot_id, scope.qq_group_id, qqid))
+    for dcid in dcids:
+        dc_to_qq_cache.pop((scope.dc_channel_id, dcid))
+
+
+async def delete_by_dcid(scope: Scope, dcid: int, qqids: Iterable[int]) -> None:
+    await write_behind.discard(scope, dcid=dcid)
+    async with get_session() as session:
+        await session.execute(
+            delete(MsgID).filter(MsgID.dcid == dcid, _dc_scope(scope.dc_channel_id))
+        )
+        await session.commit()
+    dc_to_qq_cache.pop((scope.dc_channel_id, dcid))
+    for qqid in qqids:
+        qq_to_dc_cache.pop((scope.qq_bot_id, scope.qq_group_id, qqid))
+
+
+async def flush() -> None:
+    await write_behind.close()
+
+
+DISCORD_EPOCH = 1420070400000
+
+
+def snowflake_at(time: datetime) -> int:
+    """时间对应的最小 Discord snowflake"""
+    return max(int(time.timestamp() * 1000) - DISCORD_EPOCH, 0) << 22
+
+
+def _evict_before(before: int) -> None:
+    for key, _ in dc_to_qq_cache.items():
+        if key[1] < before:
+            dc_to_qq_cache.pop(key)
+    for key, dcids in qq_to_dc_cache.items():
+        if all(dcid < before for dcid in dcids):
+            qq_to_dc_cache.pop(key)
+
+
+async def prune(before: int, chunk: int, vacuum: bool = False) -> tuple[int, float]:
+    """按 dcid 范围分批删除早于 `before` 的映射，返回删除行数与耗时"""
+    chunk = max(chunk, 1)
+    start = perf_counter()
+    removed = 0
+    while True:
+        # 每批只删除一段 dcid 区间，避免长时间持有写锁
+        async with get_session() as session:
+            upper = await session.scalar(
+                select(MsgID.dcid)
+                .filter(MsgID.dcid < before)
+                .order_by(MsgID.dcid)
+                .offset(chunk - 1)
+                .limit(1)
+            )
+            result = await session.execute(
+                delete(MsgID).filter(
+                    MsgID.dcid <= upper if upper is not None else MsgID.dcid < before
+                )
+            )
+            await session.commit()
+        removed += result.rowcount or 0
+        if upper is None:
+            break
+        await asyncio.sleep(0)
+
+    _evict_before(before)
+
+    if vacuum and removed:
+        async with get_session() as session:
+            conn = await session.connection(
+                execution_options={"isolation_level": "AUTOCOMMIT"}
+            )
+            if conn.dialect.name == "sqlite":
+                await conn.exec_driver_sql("VACUUM")
+                await conn.exec_driver_sql("ANALYZE")
+
+    return removed, perf_counter() - start
+
+
+async def prune_forever() -> None:
+    """按配置的保留时间定期清理映射表"""
+    while True:
+        before = snowflake_at(
+            datetime.now(timezone.utc) - timedelta(days=msgid_retention_days)
+        )
+        try:
+            removed, elapsed = await prune(
+                before, msgid_prune_chunk, msgid_prune_vacuum
+            )
+            logger.info(f"msgid prune: removed {removed} rows in {elapsed:.3f}s")
+        except Exception as e:
+            logger.error(f"msgid prune error: {e}")
+        await asyncio.sleep(msgid_prune_interval)
+
+
+def stats() -> dict[str, dict[str, float]]:
+    return {
+        "qq_to_dc": qq_to_dc_cache.stats(),
+        "dc_to_qq": dc_to_qq_cache.stats(),
+        "write_behind": {"pending": len(write_behind.pending)},
+    }
@@ -0,0 +1,424 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from concurrent.futures import (
+    BrokenExecutor,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from contextlib import suppress
+from hashlib import sha256
+from io import BytesIO
+import math
+import multiprocessing
+import shutil
+import subprocess
+import threading
+from time import perf_counter
+from typing import Any, TypeVar
+
+from filetype import match
+from nonebot import logger
+from nonebot_plugin_localstore import get_plugin_cache_dir
+from pydub import AudioSegment
+import pysilk
+
+from .config import (
+    transcode_cache_size,
+    transcode_queue_size,
+    transcode_timeout,
+    transcode_workers,
+)
+from .media import MediaCache
+
+T = TypeVar("T")
+
+BITRATE = "128k"
+FFMPEG = shutil.which("ffmpeg")
+TRANSCODE = "transcode"
+
+
+def pydub_transform(origin_bytes: bytes, input_type: str, output_type: str) -> bytes:
+    output_buffer = BytesIO()  # 创建内存文件对象
+
+    audio = AudioSegment.from_file(BytesIO(origin_bytes), format=input_type)
+    audio.export(output_buffer, format=output_type, bitrate=BITRATE)
+
+    output_buffer.seek(0)  # 重置指针
+    return output_buffer.read()
+
+
+def skil_to_ogg(origi_bytes: bytes) -> bytes:
+    output_buffer = BytesIO()
+
+    ft_match = match(origi_bytes)
+    if not ft_match:
+        pcm_bytes = pysilk.decode(origi_bytes, True, sample_rate=24000)
+        audio = AudioSegment.from_file(BytesIO(pcm_bytes), format="wav")
+    else:
+        audio = AudioSegment.from_file(BytesIO(origi_bytes), format=ft_match.extension)
+    audio.export(output_buffer, format="ogg", codec="libopus")
+
+    output_buffer.seek(0)
+    return output_buffer.read()
+
+
+class TranscodeTimeout(Exception):
+    """转码任务超时"""
+
+
+class TranscodeError(Exception):
+    """ffmpeg 转码失败"""
+
+
+OGG_ARGS = ["-c:a", "libopus", "-f", "ogg"]
+PCM_ARGS = ["-f", "s16le", "-ar", "24000", "-ac", "1"]
+
+
+def ffmpeg_command(
+    ffmpeg: str, source: str, input_args: list[str], output_args: list[str]
+) -> list[str]:
+    return [
+        ffmpeg,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        *input_args,
+        "-i",
+        source,
+        *output_args,
+        "pipe:1",
+    ]
+
+
+def ffmpeg_error(returncode: int, err: bytes) -> TranscodeError:
+    return TranscodeError(
+        f"ffmpeg exited with {returncode}: " + err.decode(errors="replace").strip()
+    )
+
+
+async def ffmpeg_pipe(
+    data: bytes, input_args: list[str], output_args: list[str]
+) -> bytes:
+    """通过管道调用 ffmpeg
+
+    输入写入 stdin，编码结果从 stdout 读取
+    """
+    if FFMPEG is None:
+        raise TranscodeError("ffmpeg not found")
+    proc = await asyncio.create_subprocess_exec(
+        *ffmpeg_command(FFMPEG, "pipe:0", input_args, output_args),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        out, err = await proc.communicate(data)
+    except BaseException:
+        with suppress(ProcessLookupError):
+            proc.kill()
+        # 超时或被取消时也要回收子进程，再次取消不打断回收
+        with suppress(asyncio.CancelledError):
+            await asyncio.shield(proc.wait())
+        raise
+    if proc.returncode:
+        raise ffmpeg_error(proc.returncode, err)
+    return out
+
+
+def silk_ffmpeg_to_ogg(data: bytes, ffmpeg: str, timeout: float) -> bytes:
+    """在进程池中执行：silk 解码为 PCM 后直接写入 ffmpeg
+
+    pysilk 没有流式接口，PCM 只在子进程中生成，不经过主进程
+    """
+    pcm = pysilk.decode(data, sample_rate=24000)
+    proc = subprocess.run(
+        ffmpeg_command(ffmpeg, "pipe:0", PCM_ARGS, OGG_ARGS),
+        input=pcm,
+        capture_output=True,
+        timeout=timeout,
+        check=False,
+    )
+    if proc.returncode:
+        raise ffmpeg_error(proc.returncode, proc.stderr)
+    return proc.stdout
+
+
+async def ffmpeg_to_ogg(data: bytes) -> bytes:
+    """与 `skil_to_ogg` 相同，不经过 AudioSegment
+
+    silk 的解码与 ffmpeg 调用一起在进程池中执行，其它格式直接通过管道转码
+    """
+    if FFMPEG is None:
+        raise TranscodeError("ffmpeg not found")
+    if match(data):
+        return await transcoder.submit(
+            lambda: ffmpeg_pipe(data, [], OGG_ARGS), "ffmpeg"
+        )
+    return await transcoder.run(silk_ffmpeg_to_ogg, data, FFMPEG, transcoder.timeout)
+
+
+async def ffmpeg_to_format(data: bytes, output_type: str) -> bytes:
+    """与 `pydub_transform` 相同，输入格式由 ffmpeg 自动识别"""
+    return await transcoder.submit(
+        lambda: ffmpeg_pipe(data, [], ["-b:a", BITRATE, "-f", output_type]), "ffmpeg"
+    )
+
+
+class Transcoder:
+    """在进程池中执行音频转码，避免阻塞事件循环
+
+    同时提交的任务数不超过 `workers + queue_size`，多出的任务在事件循环中等待；
+    每个任务（含排队时间）超过 `timeout` 秒时抛出 `TranscodeTimeout`，
+    超时的任务在真正结束前仍占用名额。
+    进程池使用 fork 启动，子进程无需重新导入插件；不支持 fork 或已有其它线程时
+    改用线程池
+    """
+
+    workers: int
+    queue_size: int
+    timeout: float
+    completed: int
+    failed: int
+    timeouts: int
+    broken: int
+    waiting: int
+    running: int
+    total_latency: float
+    max_latency: float
+    _executor: Executor | None
+    _slots: asyncio.Semaphore
+
+    __slots__ = (
+        "_executor",
+        "_slots",
+        "broken",
+        "completed",
+        "failed",
+        "max_latency",
+        "queue_size",
+        "running",
+        "timeout",
+        "timeouts",
+        "total_latency",
+        "waiting",
+        "workers",
+    )
+
+    def __init__(self, workers: int, queue_size: int, timeout: float):
+        self.workers = max(workers, 1)
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.broken = 0
+        self.waiting = 0
+        self.running = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._executor = None
+        self._slots = asyncio.Semaphore(self.workers + queue_size)
+
+    @property
+    def executor(self) -> Executor:
+        return self.start()
+
+    def start(self) -> Executor:
+        """创建执行器，在驱动启动时调用，未调用时由 `run` 在首次使用时创建
+
+        fork 只复制调用它的线程，其它线程（aiosqlite、`to_thread` 等）持有的锁
+        在子进程中永远不会释放。因此只在仅有主线程时以 fork 创建进程池，
+        并立即启动全部子进程，此后不再 fork；已有其它线程时改用线程池
+        """
+        if self._executor is not None:
+            return self._executor
+        if (
+            "fork" in multiprocessing.get_all_start_methods()
+            and threading.active_count() == 1
+        ):
+            executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("fork")
+            )
+            # fork 方式下首次提交时一次性启动全部子进程
+            executor.submit(int)
+            self._executor = executor
+        else:
+            logger.warning("transcoder: cannot fork safely, transcode in threads")
+            self._executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix="dcqq-relay-transcode"
+            )
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """在进程池中执行 `func(*args)`
+
+        进程池中的任务无法中止，超时后只停止等待，任务结束前仍占用名额。
+        子进程异常退出后进程池不再可用，此时丢弃进程池并抛出 `TranscodeError`，
+        下次调用时重新创建
+        """
+        executor = self.executor
+
+        def start() -> tuple[Awaitable[T], Future[T]]:
+            future = executor.submit(func, *args)
+            return asyncio.wrap_future(future), future
+
+        try:
+            return await self._submit(start, func.__name__)
+        except BrokenExecutor as e:
+            self.broken += 1
+            if self._executor is executor:
+                self.shutdown()
+            logger.error(f"transcoder: pool broken, recreate on next job: {e}")
+            raise TranscodeError(f"{func.__name__}: transcode pool broken") from e
+
+    async def submit(self, job: Callable[[], Awaitable[T]], name: str) -> T:
+        """执行异步任务（如 ffmpeg 子进程），与进程池任务共享名额、超时与统计
+
+        超时时取消任务，任务结束后释放名额
+        """
+
+        def start() -> tuple[Awaitable[T], asyncio.Future[T]]:
+            task = asyncio.ensure_future(job())
+            return task, task
+
+        return await self._submit(start, name)
+
+    async def _submit(
+        self,
+        start: Callable[[], tuple[Awaitable[T], Future[T] | asyncio.Future[T]]],
+        name: str,
+    ) -> T:
+        begin = perf_counter()
+        try:
+            return await asyncio.wait_for(self._run(start), self.timeout)
+        except asyncio.TimeoutError as e:
+            self.timeouts += 1
+            raise TranscodeTimeout(f"{name} timed out after {self.timeout}s") from e
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            latency = perf_counter() - begin
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            logger.debug(f"transcoder: {name} took {latency:.3f}s, {self.stats()}")
+
+    async def _run(
+        self, start: Callable[[], tuple[Awaitable[T], Future[T] | asyncio.Future[T]]]
+    ) -> T:
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            waiter, work = start()
+        except BaseException:
+            self._release()
+            raise
+        # 名额在任务真正结束时释放，而不是在停止等待时；进程池的回调在其它线程中执行
+        loop = asyncio.get_running_loop()
+        work.add_done_callback(lambda _: self._release_threadsafe(loop))
+        result = await waiter
+        self.completed += 1
+        return result
+
+    def _release(self) -> None:
+        self.running -= 1
+        self._slots.release()
+
+    def _release_threadsafe(self, loop: asyncio.AbstractEventLoop) -> None:
+        # 事件循环已关闭时不再需要释放
+        with suppress(RuntimeError):
+            loop.call_soon_threadsafe(self._release)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict[str, float]:
+        finished = self.completed + self.failed + self.timeouts
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "broken": self.broken,
+            "avg_latency": self.total_latency / finished if finished else 0.0,
+            "max_latency": self.max_latency,
+        }
+
+
+transcoder = Transcoder(transcode_workers, transcode_queue_size, transcode_timeout)
+transcode_cache = MediaCache(
+    get_plugin_cache_dir() / "transcode",
+    transcode_cache_size * 1024 * 1024,
+    {TRANSCODE: math.inf},
+)
+
+
+async def cached_transcode(
+    data: bytes,
+    fmt: str,
+    codec: str,
+    bitrate: str,
+    transcode: Callable[[], Awaitable[bytes]],
+) -> bytes:
+    """以 (输入的 sha256, 格式, 编码器, 码率) 为键缓存转码结果
+
+    未命中时调用 `transcode` 转码，命中时只需读取文件
+    """
+    key = f"{sha256(data).hexdigest()}:{fmt}:{codec}:{bitrate}"
+    if (cached := await transcode_cache.load(TRANSCODE, key)) is not None:
+        return cached
+    result = await transcode()
+    await transcode_cache.store(key, result)
+    logger.debug(f"transcode cache: {transcode_cache.stats()}")
+    return result
+
+
+async def pipe_or_pool(
+    pipe: Callable[[], Awaitable[bytes]], func: Callable[..., bytes], *args: Any
+) -> bytes:
+    """有 ffmpeg 时通过管道转码，没有 ffmpeg 或失败时在进程池中用 pydub 转码
+
+    `pipe` 自行通过 `transcoder` 提交任务
+    """
+    if FFMPEG is not None:
+        try:
+            return await pipe()
+        except TranscodeError as e:
+            logger.warning(f"ffmpeg pipe failed, fall back to pydub: {e}")
+    return await transcoder.run(func, *args)
+
+
+async def to_ogg(data: bytes) -> bytes:
+    """silk/amr 等语音转为 ogg (opus)"""
+    return await cached_transcode(
+        data,
+        "ogg",
+        "libopus",
+        "",
+        lambda: pipe_or_pool(lambda: ffmpeg_to_ogg(data), skil_to_ogg, data),
+    )
+
+
+async def to_format(data: bytes, input_type: str, output_type: str) -> bytes:
+    return await cached_transcode(
+        data,
+        output_type,
+        "",
+        BITRATE,
+        lambda: pipe_or_pool(
+            lambda: ffmpeg_to_format(data, output_type),
+            pydub_transform,
+            data,
+            input_type,
+            output_type,
+        ),
+    )
@@ -1,9 +1,10 @@
 import asyncio
-from io import BytesIO
+from pathlib import Path
 import re
 import ssl
+from uuid import uuid4
 
-from filetype import match
+import anyio
 from nonebot import logger
 from nonebot.adapters import Bot
 from nonebot.adapters.discord import (
@@ -11,21 +12,77 @@ from nonebot.adapters.discord import (
     GuildMessageCreateEvent,
     GuildMessageDeleteEvent,
     is_not_unset,
+    is_unset,
 )
 from nonebot.adapters.discord.exception import ActionFailed
 from nonebot.adapters.onebot.v11 import (
+    ActionFailed as qq_ActionFailed,
     Bot as qq_Bot,
     GroupMessageEvent,
     GroupRecallNoticeEvent,
 )
 from nonebot.compat import model_dump
-from nonebot.internal.driver import Request
-from pydub import AudioSegment
-import pysilk
+from nonebot.internal.driver import HTTPClientMixin, Request
+from nonebot.typing import T_State
+from nonebot_plugin_localstore import get_plugin_cache_dir
 
-from .config import LinkWithoutWebhook, LinkWithWebhook, channel_links
+from .cache import LRUCache, SingleFlight
+from .config import (
+    LinkWithoutWebhook,
+    LinkWithWebhook,
+    channel_links,
+    download_max_size,
+    download_spool_size,
+    member_cache_negative_ttl,
+    member_cache_size,
+    member_cache_ttl,
+)
+from .media import media_cache
+from .route import AnyLink, BotResolver, LinkIndex, WebhookRegistry
+
+webhook_registry = WebhookRegistry()
+link_index = LinkIndex(channel_links)
+download_flight: SingleFlight[str, bytes] = SingleFlight()
+qq_bots = BotResolver(qq_Bot, "qq_bot_id")
+dc_bots = BotResolver(dc_Bot, "dc_bot_id")
+dc_member_names: LRUCache[tuple[int, int], tuple[str, str]] = LRUCache(
+    member_cache_size, member_cache_ttl
+)
+dc_member_flight: SingleFlight[tuple[int, int], tuple[str, str]] = SingleFlight()
+qq_group_members: LRUCache[int, dict[int, str]] = LRUCache(
+    member_cache_size, member_cache_ttl
+)
+qq_group_flight: SingleFlight[int, dict[int, str]] = SingleFlight()
+qq_member_flight: SingleFlight[tuple[int, int], str] = SingleFlight()
+
+LINK_STATE_KEY = "_dcqq_relay_link"
 
-with_webhook_links: list[LinkWithWebhook] = []
+STREAM_CHUNK_SIZE = 64 * 1024
+spool_dir = get_plugin_cache_dir() / "spool"
+
+
+def match_link(
+    event: (
+        GroupMessageEvent
+        | GuildMessageCreateEvent
+        | GroupRecallNoticeEvent
+        | GuildMessageDeleteEvent
+    ),
+) -> AnyLink | None:
+    """从路由索引中找到事件对应的链接"""
+    if isinstance(event, GroupMessageEvent | GroupRecallNoticeEvent):
+        return link_index.get_qq(event.group_id)
+    elif isinstance(event, GuildMessageCreateEvent):
+        link = link_index.get_dc(event.guild_id, event.channel_id)
+        if not isinstance(link, LinkWithWebhook) or link_index.is_own_webhook(
+            event.webhook_id
+        ):
+            return None
+        return link
+    elif isinstance(event, GuildMessageDeleteEvent):
+        if is_unset(event.guild_id):
+            return None
+        return link_index.get_dc(event.guild_id, event.channel_id)
 
 
 def check_messages(
@@ -35,24 +92,13 @@ def check_messages(
         | GroupRecallNoticeEvent
         | GuildMessageDeleteEvent
     ),
+    state: T_State,
 ) -> bool:
     """检查消息"""
     logger.debug("into check_messages()")
-    if isinstance(event, GroupMessageEvent | GroupRecallNoticeEvent):
-        return any(event.group_id == link.qq_group_id for link in channel_links)
-    elif isinstance(event, GuildMessageCreateEvent):
-        return any(
-            event.guild_id == link.dc_guild_id
-            and event.channel_id == link.dc_channel_id
-            and event.webhook_id != link.webhook_id
-            for link in with_webhook_links
-        )
-    elif isinstance(event, GuildMessageDeleteEvent):
-        return any(
-            event.guild_id == link.dc_guild_id
-            and event.channel_id == link.dc_channel_id
-            for link in channel_links
-        )
+    link = match_link(event)
+    state[LINK_STATE_KEY] = link
+    return link is not None
 
 
 def check_to_me(
@@ -76,48 +122,139 @@ def get_link(
         | GroupRecallNoticeEvent
         | GuildMessageDeleteEvent
     ),
+    state: T_State,
 ) -> LinkWithWebhook | None:
-    return next(
-        (
-            link
-            for link in with_webhook_links
-            if (
-                (link.dc_channel_id == event.channel_id)
-                if isinstance(event, GuildMessageCreateEvent | GuildMessageDeleteEvent)
-                else False
-            )
-            or (
-                (link.qq_group_id == event.group_id)
-                if isinstance(event, GroupMessageEvent | GroupRecallNoticeEvent)
-                else False
-            )
-        ),
-        None,
-    )
+    link = state[LINK_STATE_KEY] if LINK_STATE_KEY in state else match_link(event)
+    return link if isinstance(link, LinkWithWebhook) else None
 
 
 async def get_dc_member_name(
     bot: dc_Bot, guild_id: int, user_id: int
 ) -> tuple[str, str]:
+    """获取 Discord 成员的 (昵称, 用户名)
+
+    结果按 (服务器, 用户) 缓存，成员更新或离开时由网关事件失效；
+    同一成员的并发查询只请求一次
+    """
+    key = (guild_id, user_id)
+    if (name := dc_member_names.get(key)) is not None:
+        return name
+    return await dc_member_flight.do(
+        key, lambda: fetch_dc_member_name(bot, guild_id, user_id)
+    )
+
+
+async def fetch_dc_member_name(
+    bot: dc_Bot, guild_id: int, user_id: int
+) -> tuple[str, str]:
+    key = (guild_id, user_id)
     try:
         member = await bot.get_guild_member(guild_id=guild_id, user_id=user_id)
-        if (nick := member.nick) and is_not_unset(nick):
-            return nick, member.user.username if is_not_unset(member.user) else ""
-        elif is_not_unset(member.user) and (global_name := member.user.global_name):
-            return global_name, member.user.username
-        else:
-            return "", str(user_id)
     except ActionFailed as e:
         if e.message == "Unknown User":
-            return "(error:未知用户)", str(user_id)
+            name = ("(error:未知用户)", str(user_id))
         elif e.message == "Unknown Guild":
             user = await bot.get_user(user_id=user_id)
-            return user.global_name or "", user.username
+            name = (user.global_name or "", user.username)
         else:
             raise e
+        # 查询失败的结果只短暂缓存
+        dc_member_names.set(key, name, member_cache_negative_ttl)
+        return name
+    if (nick := member.nick) and is_not_unset(nick):
+        name = (nick, member.user.username if is_not_unset(member.user) else "")
+    elif is_not_unset(member.user) and (global_name := member.user.global_name):
+        name = (global_name, member.user.username)
+    else:
+        name = ("", str(user_id))
+    dc_member_names.set(key, name)
+    return name
+
+
+def invalidate_dc_member(guild_id: int, user_id: int) -> None:
+    dc_member_names.pop((guild_id, user_id))
+
+
+async def get_qq_member_name(bot: qq_Bot, group_id: int, user_id: int | str) -> str:
+    """获取 QQ 群成员的昵称
+
+    每个群的成员列表整体载入并缓存，列表中没有的成员（如刚入群）单独查询
+    """
+    user_id = int(user_id)
+    members = qq_group_members.get(group_id)
+    if members is None:
+        try:
+            members = await load_qq_group_members(bot, group_id)
+        except qq_ActionFailed as e:
+            logger.warning(f"fail to get member list of group {group_id}: {e}")
+            # 失败结果短暂缓存，期间成员逐个查询，不反复请求整个列表
+            members = {}
+            qq_group_members.set(group_id, members, member_cache_negative_ttl)
+    if (name := members.get(user_id)) is not None:
+        return name
+    name = await qq_member_flight.do(
+        (group_id, user_id), lambda: fetch_qq_member_name(bot, group_id, user_id)
+    )
+    members[user_id] = name
+    return name
+
+
+async def load_qq_group_members(bot: qq_Bot, group_id: int) -> dict[int, str]:
+    """载入群成员列表，同一个群的并发载入只请求一次"""
+    return await qq_group_flight.do(
+        group_id, lambda: fetch_qq_group_members(bot, group_id)
+    )
+
+
+async def fetch_qq_group_members(bot: qq_Bot, group_id: int) -> dict[int, str]:
+    member_list = await bot.get_group_member_list(group_id=group_id)
+    members = {member["user_id"]: member["nickname"] for member in member_list}
+    qq_group_members.set(group_id, members)
+    logger.debug(f"loaded {len(members)} members of group {group_id}")
+    return members
+
+
+async def fetch_qq_member_name(bot: qq_Bot, group_id: int, user_id: int) -> str:
+    return (
+        await bot.get_group_member_info(
+            group_id=group_id, user_id=user_id, no_cache=True
+        )
+    )["nickname"]
+
+
+def invalidate_qq_group(group_id: int) -> None:
+    qq_group_members.pop(group_id)
+
+
+async def prefetch_qq_members(bot: qq_Bot) -> None:
+    """载入由 `bot` 互通的所有群的成员列表"""
+    group_ids = {
+        link.qq_group_id
+        for link in channel_links
+        if link.qq_bot_id in (None, bot.self_id)
+    }
+    for group_id in group_ids:
+        try:
+            await load_qq_group_members(bot, group_id)
+        except qq_ActionFailed as e:
+            logger.warning(f"fail to prefetch members of group {group_id}: {e}")
 
 
 async def get_file_bytes(bot: Bot, url: str, proxy: str | None = None) -> bytes:
+    if (content := await media_cache.get(url)) is not None:
+        return content
+    # 同一链接的并发下载只进行一次
+    return await download_flight.do(url, lambda: fetch_and_cache(bot, url, proxy))
+
+
+async def fetch_and_cache(bot: Bot, url: str, proxy: str | None = None) -> bytes:
+    content = await download_file(bot, url, proxy)
+    await media_cache.put(url, content)
+    logger.debug(f"media cache: {media_cache.stats()}")
+    return content
+
+
+async def download_file(bot: Bot, url: str, proxy: str | None = None) -> bytes:
     try:
         resp = await bot.adapter.request(Request("GET", url, proxy=proxy))
         if isinstance(resp.content, bytes):
@@ -128,7 +265,70 @@ async def get_file_bytes(bot: Bot, url: str, proxy: str | None = None) -> bytes:
         if url.startswith("http://"):
             raise e
         url = url.replace("https://", "http://")
-        return await get_file_bytes(bot, url, proxy)
+        return await download_file(bot, url, proxy)
+
+
+class DownloadTooLarge(Exception):
+    """下载内容超过大小上限"""
+
+
+async def stream_file(
+    bot: Bot,
+    url: str,
+    proxy: str | None = None,
+    *,
+    max_size: int = download_max_size,
+    spool: bool = True,
+) -> bytes | Path:
+    """分块下载，超过 `max_size` 时中止
+
+    `spool` 为真时，超过 `download_spool_size` 的内容写入缓存目录中的临时文件，
+    返回文件路径而不是 bytes
+    """
+    driver = bot.adapter.driver
+    if not isinstance(driver, HTTPClientMixin):
+        raise TypeError("Current driver does not support http client")
+
+    buffer = bytearray()
+    size = 0
+    path: Path | None = None
+    file = None
+    try:
+        async for resp in driver.stream_request(
+            Request("GET", url, proxy=proxy), chunk_size=STREAM_CHUNK_SIZE
+        ):
+            if not isinstance(resp.content, bytes):
+                raise TypeError("Response content is not bytes")
+            length = resp.headers.get("Content-Length")
+            size += len(resp.content)
+            if size > max_size or (length and int(length) > max_size):
+                raise DownloadTooLarge(f"{url} exceeds {max_size} bytes")
+            if file is not None:
+                await file.write(resp.content)
+                continue
+            buffer += resp.content
+            if spool and len(buffer) > download_spool_size:
+                path = spool_dir / uuid4().hex
+                await anyio.Path(spool_dir).mkdir(parents=True, exist_ok=True)
+                file = await anyio.open_file(path, "wb")
+                await file.write(buffer)
+                buffer.clear()
+    except ssl.SSLError as e:
+        if path is not None:
+            path.unlink(missing_ok=True)
+        if url.startswith("http://"):
+            raise e
+        url = url.replace("https://", "http://")
+        return await stream_file(bot, url, proxy, max_size=max_size, spool=spool)
+    except BaseException:
+        if path is not None:
+            path.unlink(missing_ok=True)
+        raise
+    finally:
+        if file is not None:
+            await file.aclose()
+
+    return path if path is not None else bytes(buffer)
 
 
 async def get_webhook(bot: dc_Bot, link: LinkWithoutWebhook) -> LinkWithWebhook | int:
@@ -178,40 +378,25 @@ def build_link(
 
 
 async def get_webhooks(bot: dc_Bot) -> list[int]:
-    global with_webhook_links
-    task = [get_webhook(bot, link) for link in channel_links]
-    links = await asyncio.gather(*task)
-    with_webhook_links.extend(
+    known = [webhook_registry.lookup(link) for link in channel_links]
+    fetched = iter(
+        await asyncio.gather(
+            *(
+                get_webhook(bot, link)
+                for link, registered in zip(channel_links, known, strict=True)
+                if registered is None
+            )
+        )
+    )
+    links = [registered or next(fetched) for registered in known]
+    webhook_registry.refresh(
         link for link in links if isinstance(link, LinkWithWebhook)
     )
+    link_index.rebuild(channel_links, webhook_registry.links())
+    logger.debug(f"webhook registry stats: {webhook_registry.stats()}")
     return [link for link in links if isinstance(link, int)]
 
 
-def pydub_transform(origin_bytes: bytes, input_type: str, output_type: str) -> bytes:
-    output_buffer = BytesIO()  # 创建内存文件对象
-
-    audio = AudioSegment.from_file(BytesIO(origin_bytes), format=input_type)
-    audio.export(output_buffer, format=output_type, bitrate="128k")
-
-    output_buffer.seek(0)  # 重置指针
-    return output_buffer.read()
-
-
-def skil_to_ogg(origi_bytes: bytes) -> bytes:
-    output_buffer = BytesIO()
-
-    ft_match = match(origi_bytes)
-    if not ft_match:
-        pcm_bytes = pysilk.decode(origi_bytes, True, sample_rate=24000)
-        audio = AudioSegment.from_file(BytesIO(pcm_bytes), format="wav")
-    else:
-        audio = AudioSegment.from_file(BytesIO(origi_bytes), format=ft_match.extension)
-    audio.export(output_buffer, format="ogg", codec="libopus")
-
-    output_buffer.seek(0)
-    return output_buffer.read()
-
-
 async def get_dc_member_avatar(bot: dc_Bot, guild_id: int, user_id: int) -> str:
     member = await bot.get_guild_member(guild_id=guild_id, user_id=user_id)
     if (avatar := member.avatar) and is_not_unset(avatar):
@@ -0,0 +1,45 @@
+import asyncio
+import os
+from pathlib import Path
+
+from .config import file_wait_timeout
+
+POLL_INTERVAL = 0.05
+POLL_MAX_INTERVAL = 0.5
+
+
+async def wait_for_file(
+    path: str | os.PathLike[str], timeout: float = file_wait_timeout
+) -> bool:
+    """等待 OneBot 实现写完文件，在 `timeout` 秒内写入完成时返回 True
+
+    轮询文件大小，相邻两次相同即视为写入完成（空文件同样如此）。
+    文件或其所在目录尚不存在时轮询间隔逐渐增大，出现后恢复为最短间隔
+    """
+    try:
+        return await asyncio.wait_for(_poll(Path(path)), timeout)
+    except asyncio.TimeoutError:
+        return False
+
+
+async def _poll(path: Path) -> bool:
+    interval = POLL_INTERVAL
+    size = _file_size(path)
+    while True:
+        await asyncio.sleep(interval)
+        current = _file_size(path)
+        if current is not None and current == size:
+            return True
+        if current is None:
+            interval = min(interval * 2, POLL_MAX_INTERVAL)
+        else:
+            interval = POLL_INTERVAL
+        size = current
+
+
+def _file_size(path: Path) -> int | None:
+    try:
+        stat = path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return stat.st_size if path.is_file() else None
@@ -1,4 +1,7 @@
-from collections.abc import Callable, Coroutine
+from collections.abc import Callable, Coroutine, Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+from unittest.mock import patch
 
 from tests.data import test_png_bytes
 
@@ -16,12 +19,16 @@ from nonebug import NONEBOT_INIT_KWARGS
 from nonebug.mixin.call_api import ApiContext
 import pytest
 
+if TYPE_CHECKING:
+    from nonebot_plugin_dcqq_relay.staging import StagingDir
+
 
 def pytest_configure(config: pytest.Config) -> None:
     config.stash[NONEBOT_INIT_KWARGS] = {
         "driver": "nonebot.drivers.aiohttp",
         "log_level": "TRACE",
         "alembic_startup_check": False,
+        "dcqq_relay_qq_member_prefetch": False,
         "dcqq_relay_channel_links": [
             {
                 "dc_guild_id": int("6" * 18),
@@ -57,6 +64,46 @@ async def reset_orm_engine():
         await engine.dispose()
 
 
+@pytest.fixture(autouse=True)
+def clear_msgid_cache():
+    from nonebot_plugin_dcqq_relay.store import dc_to_qq_cache, qq_to_dc_cache
+
+    qq_to_dc_cache.clear()
+    dc_to_qq_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_member_cache():
+    from nonebot_plugin_dcqq_relay.utils import dc_member_names, qq_group_members
+
+    dc_member_names.clear()
+    qq_group_members.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_file_modes():
+    from nonebot_plugin_dcqq_relay.dc_to_qq import file_modes
+
+    file_modes.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_guild_store():
+    from nonebot_plugin_dcqq_relay.guilds import guild_store
+
+    guild_store.clear()
+
+
+@pytest.fixture(autouse=True)
+def upload_staging(tmp_path: Path) -> Iterator["StagingDir"]:
+    # 暂存文件写入临时目录，不影响实际的缓存目录
+    from nonebot_plugin_dcqq_relay.staging import StagingDir
+
+    staging = StagingDir(tmp_path / "upload", 1024 * 1024, 3600)
+    with patch("nonebot_plugin_dcqq_relay.dc_to_qq.upload_staging", staging):
+        yield staging
+
+
 def create_bot(ctx: ApiContext) -> tuple[QQBot, DCBot]:
     dc_adapter = nonebot.get_adapter(DCAdapter)
     qq_adapter = nonebot.get_adapter(QQAdapter)
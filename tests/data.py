@@ -5,6 +5,7 @@ from zlib import decompress
 
 from nonebot.adapters.discord import (
     UNSET,
+    GuildMemberRemoveEvent,
     GuildMessageCreateEvent,
     GuildMessageDeleteEvent,
 )
@@ -199,6 +200,15 @@ def guild_message_create_event(
     return ev
 
 
+def guild_member_remove_event(
+    guild_id: str = "6" * 18, user_id: str = "3" * 18
+) -> GuildMemberRemoveEvent:
+    return type_validate_python(
+        GuildMemberRemoveEvent,
+        {"guild_id": guild_id, "user": model_dump(user(user_id))},
+    )
+
+
 def channel(
     id: str = "4" * 18, guild_id: str = "6" * 18, name: str = "test"
 ) -> Channel:
@@ -403,6 +413,13 @@ def get_test_links() -> list:
     ]
 
 
+def get_test_link_index():
+    from nonebot_plugin_dcqq_relay.route import LinkIndex
+
+    links = get_test_links()
+    return LinkIndex(links, links)
+
+
 def group_recall_event(
     message_id: int = 1, group_id: int = 10001
 ) -> GroupRecallNoticeEvent:
@@ -0,0 +1,51 @@
+from tests.conftest import create_bot
+
+from nonebug import App
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_resolve(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.config import Link
+    from nonebot_plugin_dcqq_relay.route import BotNotConnected, BotResolver
+
+    from nonebot.adapters.onebot.v11 import Bot as qq_Bot
+
+    link = Link(dc_guild_id=1, dc_channel_id=2, qq_group_id=10001)
+    pinned = Link(qq_bot_id="20002", dc_guild_id=1, dc_channel_id=2, qq_group_id=3)
+
+    async with app.test_api() as ctx:
+        qq_bot, dc_bot = create_bot(ctx)
+        resolver = BotResolver(qq_Bot, "qq_bot_id")
+        resolver.connect(qq_bot)
+        resolver.connect(dc_bot)
+        assert len(resolver) == 1
+
+        assert resolver.resolve(link) is qq_bot
+        with pytest.raises(BotNotConnected):
+            resolver.resolve(pinned)
+
+        resolver.disconnect(qq_bot)
+        # 插件加载前已连接的机器人通过回退扫描找到
+        assert resolver.resolve(link) is qq_bot
+        assert len(resolver) == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_bot(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.config import Link
+    from nonebot_plugin_dcqq_relay.route import BotNotConnected, BotResolver
+
+    from nonebot.adapters.discord import Bot as dc_Bot
+
+    link = Link(dc_guild_id=1, dc_channel_id=2, qq_group_id=10001)
+
+    async with app.test_api() as ctx:
+        _, dc_bot = create_bot(ctx)
+        resolver = BotResolver(dc_Bot, "dc_bot_id")
+        resolver.connect(dc_bot)
+
+        # 未连接到驱动器的机器人不会被使用
+        with pytest.raises(BotNotConnected):
+            resolver.resolve(link)
+        assert len(resolver) == 0
@@ -1,7 +1,7 @@
 from unittest.mock import patch
 
 from tests.data import (
-    get_test_links,
+    get_test_link_index,
     group_message_event,
     group_recall_event,
     guild_message_create_event,
@@ -11,89 +11,122 @@ from tests.data import (
 from nonebug import App
 
 
-@patch("nonebot_plugin_dcqq_relay.utils.channel_links", new_callable=get_test_links)
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
 def test_group_message_matched(app: App) -> None:
     from nonebot_plugin_dcqq_relay.utils import check_messages
 
     event = group_message_event(group_id=10001)
-    assert check_messages(event) is True
+    assert check_messages(event, {}) is True
 
 
-@patch("nonebot_plugin_dcqq_relay.utils.channel_links", new_callable=get_test_links)
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
 def test_group_message_group_id_not_in_links(app: App) -> None:
     from nonebot_plugin_dcqq_relay.utils import check_messages
 
     event = group_message_event(group_id=99999)
-    assert check_messages(event) is False
+    assert check_messages(event, {}) is False
 
 
-@patch("nonebot_plugin_dcqq_relay.utils.channel_links", new_callable=get_test_links)
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
 def test_group_recall_matched(app: App) -> None:
     from nonebot_plugin_dcqq_relay.utils import check_messages
 
     event = group_recall_event()
-    assert check_messages(event) is True
+    assert check_messages(event, {}) is True
 
 
-@patch(
-    "nonebot_plugin_dcqq_relay.utils.with_webhook_links", new_callable=get_test_links
-)
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
 def test_guild_create_matched(app: App) -> None:
     from nonebot_plugin_dcqq_relay.utils import check_messages
 
     event = guild_message_create_event(webhook_id="2")
-    assert check_messages(event) is True
+    assert check_messages(event, {}) is True
 
 
-@patch(
-    "nonebot_plugin_dcqq_relay.utils.with_webhook_links", new_callable=get_test_links
-)
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
 def test_guild_create_same_webhook_id(app: App) -> None:
     from nonebot_plugin_dcqq_relay.utils import check_messages
 
     event = guild_message_create_event(webhook_id="1")
-    assert check_messages(event) is False
+    assert check_messages(event, {}) is False
 
 
-@patch(
-    "nonebot_plugin_dcqq_relay.utils.with_webhook_links", new_callable=get_test_links
-)
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
 def test_guild_create_guild_id_not_in_links(app: App) -> None:
     from nonebot_plugin_dcqq_relay.utils import check_messages
 
     event = guild_message_create_event(guild_id="1")
-    assert check_messages(event) is False
+    assert check_messages(event, {}) is False
 
 
-@patch(
-    "nonebot_plugin_dcqq_relay.utils.with_webhook_links", new_callable=get_test_links
-)
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
 def test_guild_create_channel_id_not_in_links(app: App) -> None:
     from nonebot_plugin_dcqq_relay.utils import check_messages
 
     event = guild_message_create_event(channel_id="1")
-    assert check_messages(event) is False
+    assert check_messages(event, {}) is False
 
 
-@patch("nonebot_plugin_dcqq_relay.utils.channel_links", new_callable=get_test_links)
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
 def test_guild_delete_matched(app: App) -> None:
     from nonebot_plugin_dcqq_relay.utils import check_messages
 
     event = guild_message_delete_event()
-    assert check_messages(event) is True
+    assert check_messages(event, {}) is True
 
 
-@patch("nonebot_plugin_dcqq_relay.utils.channel_links", new_callable=get_test_links)
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
 def test_guild_delete_guild_id_not_in_links(app: App) -> None:
     from nonebot_plugin_dcqq_relay.utils import check_messages
 
     event = guild_message_delete_event(guild_id="9" * 18)
-    assert check_messages(event) is False
+    assert check_messages(event, {}) is False
 
 
-@patch("nonebot_plugin_dcqq_relay.utils.channel_links", new_callable=get_test_links)
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
 def test_guild_delete_channel_id_not_in_links(app: App) -> None:
     from nonebot_plugin_dcqq_relay.utils import check_messages
 
     event = guild_message_delete_event(channel_id="9" * 18)
-    assert check_messages(event) is False
+    assert check_messages(event, {}) is False
+
+
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
+def test_guild_create_other_link_webhook_id(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.config import LinkWithWebhook
+    from nonebot_plugin_dcqq_relay.route import LinkIndex
+    from nonebot_plugin_dcqq_relay.utils import check_messages
+
+    links = [
+        LinkWithWebhook(
+            dc_guild_id=int("6" * 18),
+            dc_channel_id=int("2" * 18),
+            qq_group_id=10001,
+            webhook_id=1,
+            webhook_token="x",
+        ),
+        LinkWithWebhook(
+            dc_guild_id=int("6" * 18),
+            dc_channel_id=int("3" * 18),
+            qq_group_id=10002,
+            webhook_id=3,
+            webhook_token="x",
+        ),
+    ]
+    with patch("nonebot_plugin_dcqq_relay.utils.link_index", LinkIndex(links, links)):
+        event = guild_message_create_event(webhook_id="3")
+        assert check_messages(event, {}) is False
+
+
+@patch("nonebot_plugin_dcqq_relay.utils.link_index", new_callable=get_test_link_index)
+def test_get_link_shares_rule_lookup(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.utils import check_messages, get_link
+
+    event = group_message_event(group_id=10001)
+    state = {}
+    assert check_messages(event, state) is True
+    with patch("nonebot_plugin_dcqq_relay.utils.match_link") as match_link:
+        link = get_link(None, event, state)  # type: ignore
+        match_link.assert_not_called()
+    assert link is not None
+    assert link.qq_group_id == 10001
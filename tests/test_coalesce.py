@@ -0,0 +1,152 @@
+import asyncio
+from unittest.mock import patch
+
+from tests.conftest import create_bot
+from tests.data import (
+    execute_webhook_data,
+    execute_webhook_result,
+    get_test_link_index,
+    get_test_links,
+    group_message_event,
+    group_recall_event,
+)
+
+from nonebot.adapters.onebot.v11 import Message as QQMessage, MessageSegment
+from nonebug import App
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_coalesce_same_sender(app: App) -> None:
+    with (
+        patch(
+            "nonebot_plugin_dcqq_relay.utils.link_index",
+            new_callable=get_test_link_index,
+        ),
+        patch("nonebot_plugin_dcqq_relay.coalesce_window", 0.05),
+    ):
+        from nonebot_plugin_dcqq_relay import message_relay, pending_texts
+        from nonebot_plugin_dcqq_relay.store import get_dcids, get_qqids
+
+        link = get_test_links()[0]
+        async with app.test_matcher() as ctx:
+            qq_bot, dc_bot = create_bot(ctx)
+            dc_bot.adapter.driver._bots[dc_bot.self_id] = dc_bot
+
+            ctx.should_call_api(
+                api="execute_webhook",
+                data=execute_webhook_data(content="first\nsecond"),
+                result=execute_webhook_result(content="first\nsecond"),
+            )
+            events = [
+                group_message_event("first").model_copy(update={"message_id": 21}),
+                group_message_event("second").model_copy(update={"message_id": 22}),
+            ]
+            await asyncio.gather(
+                *(message_relay(qq_bot, event, link) for event in events)
+            )
+            assert not pending_texts
+
+            # 多条 QQ 消息对应同一条 Discord 消息
+            assert await get_qqids(0, dc_channel_id=link.dc_channel_id) == (21, 22)
+
+            # 撤回其中一条时删除整条消息，其余映射一并删除
+            ctx.should_call_api(
+                api="delete_message",
+                data={"channel_id": link.dc_channel_id, "message_id": 0},
+                result=None,
+            )
+            recall = group_recall_event(21).model_copy(
+                update={"self_id": int(qq_bot.self_id)}
+            )
+            await message_relay(qq_bot, recall, link)
+            assert not await get_dcids(
+                22, qq_group_id=link.qq_group_id, qq_bot_id=int(qq_bot.self_id)
+            )
+
+
+@pytest.mark.asyncio
+async def test_coalesce_flush(app: App) -> None:
+    with (
+        patch(
+            "nonebot_plugin_dcqq_relay.utils.link_index",
+            new_callable=get_test_link_index,
+        ),
+        patch("nonebot_plugin_dcqq_relay.coalesce_window", 10),
+    ):
+        from nonebot_plugin_dcqq_relay import message_relay, pending_texts
+
+        link = get_test_links()[0]
+        async with app.test_matcher() as ctx:
+            qq_bot, dc_bot = create_bot(ctx)
+            dc_bot.adapter.driver._bots[dc_bot.self_id] = dc_bot
+
+            # 不同发送者与非纯文本消息都会立即发送等待中的消息
+            ctx.should_call_api(
+                api="execute_webhook",
+                data=execute_webhook_data(content="first"),
+                result=execute_webhook_result(content="first"),
+            )
+            ctx.should_call_api(
+                api="execute_webhook",
+                data=execute_webhook_data(
+                    content="other", username="other", user_id=10004
+                ),
+                result=execute_webhook_result(content="other"),
+            )
+            ctx.should_call_api(
+                api="execute_webhook",
+                data=execute_webhook_data(content="reply[撇嘴]"),
+                result=execute_webhook_result(content="reply[撇嘴]"),
+            )
+            reply = group_message_event(
+                QQMessage([MessageSegment.text("reply"), MessageSegment.face(1)])
+            )
+            await asyncio.wait_for(
+                asyncio.gather(
+                    message_relay(qq_bot, group_message_event("first"), link),
+                    message_relay(
+                        qq_bot,
+                        group_message_event("other", username="other", user_id=10004),
+                        link,
+                    ),
+                    message_relay(qq_bot, reply, link),
+                ),
+                1,
+            )
+            assert not pending_texts
+
+
+@pytest.mark.asyncio
+async def test_coalesce_outside_lane(app: App) -> None:
+    with patch("nonebot_plugin_dcqq_relay.coalesce_window", 10):
+        from nonebot_plugin_dcqq_relay import (
+            link_sequencer,
+            message_relay,
+            pending_texts,
+        )
+
+        link = get_test_links()[0]
+        merged: list[tuple] = []
+
+        async def fake_relay(bot, event, link, merged_events=()) -> None:
+            merged.append((event.message_id, len(merged_events)))
+
+        async with app.test_api() as ctx:
+            qq_bot, _ = create_bot(ctx)
+            with patch("nonebot_plugin_dcqq_relay.relay", fake_relay):
+                first = asyncio.create_task(
+                    message_relay(qq_bot, group_message_event("first"), link)
+                )
+                await asyncio.sleep(0)
+
+                # 合并窗口内链接队列保持空闲
+                assert link_sequencer.stats()["lanes"] == 0
+                (batch,) = pending_texts.values()
+
+                batch.closed.set()
+                await asyncio.wait_for(first, 1)
+
+        assert merged == [(batch.events[0].message_id, 0)]
+        assert batch.done.done()
+        assert not pending_texts
@@ -173,13 +173,15 @@ async def test_convert_at(app: App) -> None:
         qq = "10001"
         group_id = 10001
         ctx.should_call_api(
-            api="get_group_member_info",
-            data={"group_id": group_id, "user_id": qq, "no_cache": True},
-            result={
-                "group_id": group_id,
-                "user_id": int(qq),
-                "nickname": name,
-            },
+            api="get_group_member_list",
+            data={"group_id": group_id},
+            result=[
+                {
+                    "group_id": group_id,
+                    "user_id": int(qq),
+                    "nickname": name,
+                }
+            ],
         )
         result = await builder.convert(
             seg=QQMessageSegment.at(10001),
@@ -341,6 +343,31 @@ async def test_convert_record(app: App, httpserver: HTTPServer) -> None:
         assert result.file.filename == "voice-message.ogg"
 
 
+@pytest.mark.asyncio
+async def test_convert_record_failed(app: App, httpserver: HTTPServer) -> None:
+    from unittest.mock import patch
+
+    from nonebot_plugin_dcqq_relay.qq_to_dc import MessageBuilder
+    from nonebot_plugin_dcqq_relay.transcode import TranscodeError
+
+    httpserver.expect_request("/test.amr").respond_with_data(amr_bytes)
+    url = httpserver.url_for("/test.amr")
+    async with app.test_api() as ctx:
+        bot, _ = create_bot(ctx)
+        # 转码失败（如进程池崩溃）时只转发文字
+        with patch(
+            "nonebot_plugin_dcqq_relay.qq_to_dc.to_ogg",
+            side_effect=TranscodeError("transcode pool broken"),
+        ):
+            result = await MessageBuilder().convert(
+                seg=QQMessageSegment("record", {"file": "test.amr", "url": url}),
+                bot=bot,
+                event=group_message_event(),
+            )
+        assert result.text == "[语音]"
+        assert result.file is None
+
+
 @pytest.mark.asyncio
 async def test_convert_video(app: App, httpserver: HTTPServer) -> None:
     from nonebot_plugin_dcqq_relay.qq_to_dc import MessageBuilder, MsgResult
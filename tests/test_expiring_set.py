@@ -0,0 +1,72 @@
+from unittest.mock import patch
+
+from nonebug import App
+
+
+def test_pop_once(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.cache import ExpiringSet
+
+    echo: ExpiringSet[int] = ExpiringSet(ttl=60, maxsize=10)
+    echo.add(1)
+    assert 1 in echo
+    assert echo.pop(1) is True
+    assert echo.pop(1) is False
+    assert len(echo) == 0
+
+
+def test_expire(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.cache import ExpiringSet
+
+    with patch("nonebot_plugin_dcqq_relay.cache.monotonic") as monotonic:
+        monotonic.return_value = 0
+        echo: ExpiringSet[int] = ExpiringSet(ttl=60, maxsize=10, buckets=6)
+        echo.add(1)
+        monotonic.return_value = 30
+        echo.add(2)
+        assert len(echo) == 2
+
+        monotonic.return_value = 61
+        assert 1 not in echo
+        assert 2 in echo
+        assert len(echo) == 1
+
+        monotonic.return_value = 91
+        assert echo.pop(2) is False
+        assert len(echo) == 0
+
+
+def test_maxsize(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.cache import ExpiringSet
+
+    echo: ExpiringSet[int] = ExpiringSet(ttl=60, maxsize=3)
+    for i in range(10):
+        echo.add(i)
+    assert len(echo) == 3
+
+
+def test_maxsize_after_discard(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.cache import ExpiringSet
+
+    with patch("nonebot_plugin_dcqq_relay.cache.monotonic") as monotonic:
+        monotonic.return_value = 0
+        echo: ExpiringSet[int] = ExpiringSet(ttl=60, maxsize=2)
+        echo.add(1)
+        echo.discard(1)
+
+        # 被清空的桶仍在队首，超出容量时应跳过
+        monotonic.return_value = 10
+        for i in range(2, 5):
+            echo.add(i)
+        assert len(echo) == 2
+        assert 2 not in echo
+        assert 4 in echo
+
+
+def test_delete_echo_directions(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.cache import DeleteEcho
+
+    just_delete = DeleteEcho(ttl=60, maxsize=10)
+    just_delete.dc.add(1)
+    assert just_delete.stats() == {"qq": 0, "dc": 1}
+    assert just_delete.qq.pop(1) is False
+    assert just_delete.dc.pop(1) is True
@@ -0,0 +1,40 @@
+import asyncio
+from pathlib import Path
+
+from nonebug import App
+import pytest
+
+
+def write(path: Path, content: bytes) -> None:
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(content)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_new_file(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.watch import wait_for_file
+
+    path = tmp_path / "a.amr"
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.05, write, path, b"voice")
+
+    assert await wait_for_file(path, 2)
+    assert await wait_for_file(path, 2)
+    assert not await wait_for_file(tmp_path / "b.amr", 0.1)
+
+    # 空文件大小不变时同样视为写入完成
+    (tmp_path / "empty.amr").touch()
+    assert await wait_for_file(tmp_path / "empty.amr", 2)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_missing_dir(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.watch import wait_for_file
+
+    # 所在目录稍后才创建时继续等待
+    path = tmp_path / "record" / "a.amr"
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.1, write, path, b"voice")
+
+    assert await wait_for_file(path, 2)
+    assert not await wait_for_file(tmp_path / "missing" / "b.amr", 0.1)
@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 from tests.conftest import create_bot
 from tests.data import guild_member
 
@@ -158,3 +160,83 @@ async def test_other_error(app: App) -> None:
         )
         with pytest.RaisesExc(ActionFailed):
             await get_dc_member_name(dc_bot, **call_data)
+
+
+@pytest.mark.asyncio
+async def test_cache_and_invalidate(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.utils import (
+        dc_member_names,
+        get_dc_member_name,
+        invalidate_dc_member,
+    )
+
+    async with app.test_api() as ctx:
+        _, dc_bot = create_bot(ctx)
+
+        call_data: dict[str, int] = {"guild_id": 1, "user_id": 2}
+
+        ctx.should_call_api(
+            api="get_guild_member",
+            data=call_data,
+            result=guild_member(nick="Old", username="test"),
+        )
+        assert await get_dc_member_name(dc_bot, **call_data) == ("Old", "test")
+        assert await get_dc_member_name(dc_bot, **call_data) == ("Old", "test")
+        assert dc_member_names.stats()["hits"] == 1
+
+        invalidate_dc_member(**call_data)
+        ctx.should_call_api(
+            api="get_guild_member",
+            data=call_data,
+            result=guild_member(nick="New", username="test"),
+        )
+        assert await get_dc_member_name(dc_bot, **call_data) == ("New", "test")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_miss(app: App) -> None:
+    import asyncio
+
+    from nonebot_plugin_dcqq_relay.utils import get_dc_member_name
+
+    async with app.test_api() as ctx:
+        _, dc_bot = create_bot(ctx)
+
+        call_data: dict[str, int] = {"guild_id": 1, "user_id": 2}
+
+        ctx.should_call_api(
+            api="get_guild_member",
+            data=call_data,
+            result=guild_member(nick="Test", username="test"),
+        )
+        results = await asyncio.gather(
+            *(get_dc_member_name(dc_bot, **call_data) for _ in range(3))
+        )
+        assert results == [("Test", "test")] * 3
+
+
+@pytest.mark.asyncio
+async def test_negative_cache(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.utils import dc_member_names, get_dc_member_name
+
+    async with app.test_api() as ctx:
+        _, dc_bot = create_bot(ctx)
+
+        call_data: dict[str, int] = {"guild_id": 1, "user_id": 2}
+
+        ctx.should_call_api(
+            api="get_guild_member",
+            data=call_data,
+            exception=ActionFailed(
+                Response(
+                    status_code=404,
+                    content=b'{"message": "Unknown User", "code": 10013}',
+                )
+            ),
+        )
+        name = ("(error:未知用户)", str(call_data["user_id"]))
+        assert await get_dc_member_name(dc_bot, **call_data) == name
+        assert await get_dc_member_name(dc_bot, **call_data) == name
+
+        with patch("nonebot_plugin_dcqq_relay.cache.monotonic", return_value=1e12):
+            assert dc_member_names.get((1, 2)) is None
@@ -15,3 +15,32 @@ async def test_ssl_error(app: App, httpserver: HTTPServer) -> None:
     async with app.test_api() as ctx:
         bot, _ = create_bot(ctx)
         assert await get_file_bytes(bot, url) == b"{}"
+
+
+@pytest.mark.asyncio
+async def test_stream_file(app: App, httpserver: HTTPServer) -> None:
+    from pathlib import Path
+    from unittest.mock import patch
+
+    httpserver.expect_request("/test").respond_with_data(b"x" * 300)
+    url = httpserver.url_for("/test")
+
+    from nonebot_plugin_dcqq_relay.utils import DownloadTooLarge, stream_file
+
+    async with app.test_api() as ctx:
+        bot, _ = create_bot(ctx)
+        assert await stream_file(bot, url) == b"x" * 300
+
+        with (
+            patch("nonebot_plugin_dcqq_relay.utils.STREAM_CHUNK_SIZE", 64),
+            patch("nonebot_plugin_dcqq_relay.utils.download_spool_size", 100),
+        ):
+            path = await stream_file(bot, url)
+            assert isinstance(path, Path)
+            assert path.read_bytes() == b"x" * 300
+            path.unlink()
+
+            assert await stream_file(bot, url, spool=False) == b"x" * 300
+
+            with pytest.raises(DownloadTooLarge):
+                await stream_file(bot, url, max_size=200)
@@ -0,0 +1,114 @@
+import asyncio
+
+from tests.conftest import create_bot
+
+from nonebot.adapters.onebot.v11 import ActionFailed, NoticeEvent
+from nonebug import App
+import pytest
+
+GROUP_ID = 10001
+
+
+def member(user_id: int, nickname: str) -> dict:
+    return {"group_id": GROUP_ID, "user_id": user_id, "nickname": nickname}
+
+
+@pytest.mark.asyncio
+async def test_bulk_load(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.utils import get_qq_member_name
+
+    async with app.test_api() as ctx:
+        qq_bot, _ = create_bot(ctx)
+
+        ctx.should_call_api(
+            api="get_group_member_list",
+            data={"group_id": GROUP_ID},
+            result=[member(1, "one"), member(2, "two")],
+        )
+        names = await asyncio.gather(
+            get_qq_member_name(qq_bot, GROUP_ID, 1),
+            get_qq_member_name(qq_bot, GROUP_ID, "2"),
+        )
+        assert names == ["one", "two"]
+
+        # 列表中没有的成员单独查询，之后同样命中缓存
+        ctx.should_call_api(
+            api="get_group_member_info",
+            data={"group_id": GROUP_ID, "user_id": 3, "no_cache": True},
+            result=member(3, "three"),
+        )
+        assert await get_qq_member_name(qq_bot, GROUP_ID, 3) == "three"
+        assert await get_qq_member_name(qq_bot, GROUP_ID, 3) == "three"
+
+
+@pytest.mark.asyncio
+async def test_list_failed(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.utils import get_qq_member_name
+
+    async with app.test_api() as ctx:
+        qq_bot, _ = create_bot(ctx)
+
+        ctx.should_call_api(
+            api="get_group_member_list",
+            data={"group_id": GROUP_ID},
+            exception=ActionFailed(retcode=100),
+        )
+        ctx.should_call_api(
+            api="get_group_member_info",
+            data={"group_id": GROUP_ID, "user_id": 1, "no_cache": True},
+            result=member(1, "one"),
+        )
+        assert await get_qq_member_name(qq_bot, GROUP_ID, 1) == "one"
+
+        # 失败结果短暂缓存，之后的成员不再请求整个列表
+        ctx.should_call_api(
+            api="get_group_member_info",
+            data={"group_id": GROUP_ID, "user_id": 2, "no_cache": True},
+            result=member(2, "two"),
+        )
+        assert await get_qq_member_name(qq_bot, GROUP_ID, 2) == "two"
+        assert await get_qq_member_name(qq_bot, GROUP_ID, 1) == "one"
+
+
+@pytest.mark.asyncio
+async def test_prefetch(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.utils import prefetch_qq_members, qq_group_members
+
+    async with app.test_api() as ctx:
+        qq_bot, _ = create_bot(ctx)
+
+        ctx.should_call_api(
+            api="get_group_member_list",
+            data={"group_id": GROUP_ID},
+            result=[member(1, "one")],
+        )
+        await prefetch_qq_members(qq_bot)
+
+    assert qq_group_members.get(GROUP_ID) == {1: "one"}
+
+
+@pytest.mark.asyncio
+async def test_member_notice(app: App) -> None:
+    from nonebot_plugin_dcqq_relay import qq_member_changed
+    from nonebot_plugin_dcqq_relay.utils import qq_group_members
+
+    qq_group_members.set(GROUP_ID, {1: "one"})
+    event = NoticeEvent.model_validate(
+        {
+            "time": 0,
+            "self_id": 12345,
+            "post_type": "notice",
+            "notice_type": "group_card",
+            "group_id": GROUP_ID,
+            "user_id": 1,
+            "card_new": "new",
+            "card_old": "",
+        }
+    )
+
+    async with app.test_matcher(qq_member_changed) as ctx:
+        qq_bot, _ = create_bot(ctx)
+        ctx.receive_event(qq_bot, event)
+        ctx.should_pass_rule()
+
+    assert qq_group_members.get(GROUP_ID) is None
@@ -0,0 +1,111 @@
+from tests.conftest import create_bot
+from tests.data import channel, role
+
+from nonebot.adapters.discord import (
+    ChannelDeleteEvent,
+    ChannelUpdateEvent,
+    GuildCreateEvent,
+    GuildRoleDeleteEvent,
+    GuildRoleUpdateEvent,
+)
+from nonebot.adapters.discord.utils import model_dump
+from nonebot.compat import type_validate_python
+from nonebug import App
+import pytest
+
+GUILD_ID = int("6" * 18)
+
+
+def guild_create_event() -> GuildCreateEvent:
+    return type_validate_python(
+        GuildCreateEvent,
+        {
+            "id": str(GUILD_ID),
+            "name": "Test Guild",
+            "roles": [model_dump(role("1", "admin")), model_dump(role("2", "mod"))],
+            "channels": [model_dump(channel("3", name="general"))],
+        },
+    )
+
+
+def test_handle_events(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.guilds import GuildStore
+
+    store = GuildStore()
+    store.handle(guild_create_event())
+    assert store.guild_name(GUILD_ID) == "Test Guild"
+    assert store.role_name(GUILD_ID, 1) == "admin"
+    assert store.channel_name(3) == "general"
+
+    store.handle(
+        type_validate_python(
+            GuildRoleUpdateEvent,
+            {"guild_id": str(GUILD_ID), "role": model_dump(role("1", "owner"))},
+        )
+    )
+    store.handle(
+        type_validate_python(
+            GuildRoleDeleteEvent, {"guild_id": str(GUILD_ID), "role_id": "2"}
+        )
+    )
+    assert store.role_name(GUILD_ID, 1) == "owner"
+    assert store.role_name(GUILD_ID, 2) is None
+
+    store.handle(
+        type_validate_python(
+            ChannelUpdateEvent, model_dump(channel("4", name="random"))
+        )
+    )
+    store.handle(type_validate_python(ChannelDeleteEvent, model_dump(channel("3"))))
+    assert store.channel_name(3) is None
+    assert store.channel_name(4) == "random"
+    assert store.stats() == {"guilds": 1, "roles": 1, "channels": 1}
+
+
+@pytest.mark.asyncio
+async def test_resolve_locally(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.dc_to_qq import (
+        get_dc_channel_name,
+        get_dc_guild_name,
+        get_dc_role_name,
+    )
+    from nonebot_plugin_dcqq_relay.guilds import guild_store
+
+    guild_store.handle(guild_create_event())
+
+    async with app.test_api() as ctx:
+        _, dc_bot = create_bot(ctx)
+        assert await get_dc_role_name(dc_bot, GUILD_ID, 2) == "mod"
+        assert await get_dc_channel_name(dc_bot, 3) == "general"
+        assert await get_dc_guild_name(dc_bot, GUILD_ID) == "Test Guild"
+
+
+@pytest.mark.asyncio
+async def test_rest_fallback(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.dc_to_qq import get_dc_role_name
+    from nonebot_plugin_dcqq_relay.guilds import guild_store
+
+    async with app.test_api() as ctx:
+        _, dc_bot = create_bot(ctx)
+        ctx.should_call_api(
+            api="get_guild_role",
+            data={"guild_id": GUILD_ID, "role_id": 5},
+            result=role("5", "new"),
+        )
+        assert await get_dc_role_name(dc_bot, GUILD_ID, 5) == "new"
+        assert await get_dc_role_name(dc_bot, GUILD_ID, 5) == "new"
+
+    assert guild_store.role_name(GUILD_ID, 5) == "new"
+
+
+@pytest.mark.asyncio
+async def test_guild_changed(app: App) -> None:
+    from nonebot_plugin_dcqq_relay import guild_changed
+    from nonebot_plugin_dcqq_relay.guilds import guild_store
+
+    async with app.test_matcher(guild_changed) as ctx:
+        _, dc_bot = create_bot(ctx)
+        ctx.receive_event(dc_bot, guild_create_event())
+        ctx.should_pass_rule()
+
+    assert guild_store.role_name(GUILD_ID, 1) == "admin"
@@ -4,9 +4,11 @@ from tests.conftest import create_bot
 from tests.data import (
     execute_webhook_data,
     execute_webhook_result,
+    get_test_link_index,
     get_test_links,
     group_message_event,
     group_recall_event,
+    guild_member_remove_event,
     guild_message_create_event,
     guild_message_delete_event,
     message_get,
@@ -22,8 +24,8 @@ from sqlalchemy import select
 @pytest.mark.asyncio
 async def test_create_dc_to_qq(app: App) -> None:
     with patch(
-        target="nonebot_plugin_dcqq_relay.utils.with_webhook_links",
-        new_callable=get_test_links,
+        target="nonebot_plugin_dcqq_relay.utils.link_index",
+        new_callable=get_test_link_index,
     ):
         from nonebot_plugin_dcqq_relay import matcher
         from nonebot_plugin_dcqq_relay.model import MsgID
@@ -35,11 +37,6 @@ async def test_create_dc_to_qq(app: App) -> None:
 
             ctx.receive_event(dc_bot, guild_message_create_event())
             ctx.should_pass_rule()
-            ctx.should_call_api(
-                api="get_version_info",
-                data={},
-                result={"app_name": "other"},
-            )
             ctx.should_call_api(
                 api="send_group_msg",
                 data=send_group_msg_data(),
@@ -61,8 +58,8 @@ async def test_create_dc_to_qq(app: App) -> None:
 @pytest.mark.asyncio
 async def test_create_dc_to_qq_ensure_message(app: App) -> None:
     with patch(
-        target="nonebot_plugin_dcqq_relay.utils.with_webhook_links",
-        new_callable=get_test_links,
+        target="nonebot_plugin_dcqq_relay.utils.link_index",
+        new_callable=get_test_link_index,
     ):
         from nonebot_plugin_dcqq_relay import matcher
         from nonebot_plugin_dcqq_relay.model import MsgID
@@ -82,11 +79,6 @@ async def test_create_dc_to_qq_ensure_message(app: App) -> None:
                 },
                 result=message_get(),
             )
-            ctx.should_call_api(
-                api="get_version_info",
-                data={},
-                result={"app_name": "other"},
-            )
             ctx.should_call_api(
                 api="send_group_msg",
                 data=send_group_msg_data(),
@@ -110,8 +102,8 @@ async def test_create_qq_to_dc(
     app: App,
 ) -> None:
     with patch(
-        target="nonebot_plugin_dcqq_relay.utils.with_webhook_links",
-        new_callable=get_test_links,
+        target="nonebot_plugin_dcqq_relay.utils.link_index",
+        new_callable=get_test_link_index,
     ):
         from nonebot_plugin_dcqq_relay import matcher
         from nonebot_plugin_dcqq_relay.model import MsgID
@@ -143,8 +135,8 @@ async def test_create_qq_to_dc(
 @pytest.mark.asyncio
 async def test_delete_qq_to_dc(app: App) -> None:
     with patch(
-        target="nonebot_plugin_dcqq_relay.utils.with_webhook_links",
-        new_callable=get_test_links,
+        target="nonebot_plugin_dcqq_relay.utils.link_index",
+        new_callable=get_test_link_index,
     ):
         from nonebot_plugin_dcqq_relay import matcher
         from nonebot_plugin_dcqq_relay.model import MsgID
@@ -184,8 +176,8 @@ async def test_delete_qq_to_dc(app: App) -> None:
 @pytest.mark.asyncio
 async def test_delete_dc_to_qq(app: App) -> None:
     with patch(
-        target="nonebot_plugin_dcqq_relay.utils.with_webhook_links",
-        new_callable=get_test_links,
+        target="nonebot_plugin_dcqq_relay.utils.link_index",
+        new_callable=get_test_link_index,
     ):
         from nonebot_plugin_dcqq_relay import matcher
         from nonebot_plugin_dcqq_relay.model import MsgID
@@ -231,15 +223,15 @@ async def test_handle_get_link_none(app: App) -> None:
 @pytest.mark.asyncio
 async def test_handle_type_not_match(app: App) -> None:
     with patch(
-        "nonebot_plugin_dcqq_relay.utils.with_webhook_links",
-        new_callable=get_test_links,
+        "nonebot_plugin_dcqq_relay.utils.link_index",
+        new_callable=get_test_link_index,
     ):
-        from nonebot_plugin_dcqq_relay import message_relay
+        from nonebot_plugin_dcqq_relay import relay
 
         async with app.test_matcher() as ctx:
             qq_bot, _ = create_bot(ctx)
 
-            await message_relay(qq_bot, guild_message_create_event())
+            await relay(qq_bot, guild_message_create_event(), get_test_links()[0])
 
 
 @pytest.mark.asyncio
@@ -287,3 +279,44 @@ async def test_matcher_only_to_me(app: App) -> None:
         ctx.should_pass_rule()
         ctx.receive_event(dc_bot, guild_message_delete_event())
         ctx.should_pass_rule()
+
+
+@pytest.mark.asyncio
+async def test_create_qq_to_dc_bot_offline(app: App) -> None:
+    with patch(
+        target="nonebot_plugin_dcqq_relay.utils.link_index",
+        new_callable=get_test_link_index,
+    ):
+        from nonebot_plugin_dcqq_relay import matcher
+        from nonebot_plugin_dcqq_relay.model import MsgID
+
+        from nonebot_plugin_orm import get_session
+
+        async with app.test_matcher(matcher) as ctx:
+            qq_bot, dc_bot = create_bot(ctx)
+            qq_bot.adapter.driver._bots.pop(dc_bot.self_id, None)
+
+            # Discord 机器人未连接，不调用任何 API 也不重试
+            ctx.receive_event(qq_bot, group_message_event())
+            ctx.should_pass_rule()
+
+        async with get_session() as session:
+            assert not (
+                await session.scalars(select(MsgID).filter(MsgID.dcid == 0))
+            ).all()
+
+
+@pytest.mark.asyncio
+async def test_member_changed(app: App) -> None:
+    from nonebot_plugin_dcqq_relay import member_changed
+    from nonebot_plugin_dcqq_relay.utils import dc_member_names
+
+    key = (int("6" * 18), int("3" * 18))
+    dc_member_names.set(key, ("Test", "test"))
+
+    async with app.test_matcher(member_changed) as ctx:
+        _, dc_bot = create_bot(ctx)
+        ctx.receive_event(dc_bot, guild_member_remove_event())
+        ctx.should_pass_rule()
+
+    assert dc_member_names.get(key) is None
@@ -0,0 +1,113 @@
+import os
+from pathlib import Path
+import time
+from unittest.mock import patch
+
+from tests.conftest import create_bot
+
+from nonebug import App
+import pytest
+
+EMOJI = "https://cdn.discordapp.com/emojis/1234.webp"
+ATTACHMENT = "https://cdn.discordapp.com/attachments/1/2/a.png?ex=1&is=2&hm=3"
+
+
+def blobs(root: Path) -> list[Path]:
+    return sorted(root.glob("blobs/*/*"), key=lambda path: path.read_bytes())
+
+
+def age(root: Path, seconds: float) -> None:
+    old = time.time() - seconds
+    for path in root.glob("keys/*/*"):
+        os.utime(path, (old, old))
+
+
+def test_normalize_url(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.media import normalize_url
+
+    assert normalize_url(EMOJI) == ("static", EMOJI)
+    assert normalize_url("http://CDN.discordapp.com/emojis/1234.webp#x") == (
+        "static",
+        EMOJI,
+    )
+    assert normalize_url(ATTACHMENT) == (
+        "attachment",
+        "https://cdn.discordapp.com/attachments/1/2/a.png",
+    )
+    assert normalize_url(
+        "https://multimedia.nt.qq.com.cn/download?fileid=f&appid=1&rkey=r"
+    ) == (
+        "attachment",
+        "https://multimedia.nt.qq.com.cn/download?appid=1&fileid=f",
+    )
+    assert normalize_url("https://example.com/a.png") is None
+
+
+@pytest.mark.asyncio
+async def test_hit_and_dedupe(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.media import MediaCache
+
+    cache = MediaCache(tmp_path, 1024, {"static": 60, "attachment": 60})
+    assert await cache.get(EMOJI) is None
+    await cache.put(EMOJI, b"emoji")
+    await cache.put(ATTACHMENT, b"emoji")
+    await cache.put("https://example.com/a.png", b"other")
+
+    assert await cache.get(EMOJI) == b"emoji"
+    assert await cache.get(ATTACHMENT.replace("ex=1", "ex=9")) == b"emoji"
+    assert await cache.get("https://example.com/a.png") is None
+    assert len(blobs(tmp_path)) == 1
+    assert cache.stats() == {
+        "size": 5,
+        "max_bytes": 1024,
+        "hits": 2,
+        "misses": 1,
+        "hit_ratio": 2 / 3,
+        "bytes_saved": 10,
+    }
+
+
+@pytest.mark.asyncio
+async def test_ttl(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.media import MediaCache
+
+    cache = MediaCache(tmp_path, 1024, {"static": 3600, "attachment": 60})
+    await cache.put(EMOJI, b"emoji")
+    await cache.put(ATTACHMENT, b"attachment")
+    age(tmp_path, 120)
+
+    assert await cache.get(EMOJI) == b"emoji"
+    assert await cache.get(ATTACHMENT) is None
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.media import MediaCache
+
+    cache = MediaCache(tmp_path, 10, {"static": 60, "attachment": 60})
+    await cache.put(f"{EMOJI}?1", b"aaaa")
+    await cache.put(f"{EMOJI}?2", b"bbbb")
+    for i, path in enumerate(blobs(tmp_path)):
+        os.utime(path, (i, i))
+
+    # 最近使用过的内容被保留
+    assert await cache.get(f"{EMOJI}?1") == b"aaaa"
+    await cache.put(f"{EMOJI}?3", b"cccc")
+
+    assert [path.read_bytes() for path in blobs(tmp_path)] == [b"aaaa", b"cccc"]
+    assert await cache.get(f"{EMOJI}?2") is None
+    assert cache.stats()["size"] == 8
+
+
+@pytest.mark.asyncio
+async def test_get_file_bytes_cached(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.media import MediaCache
+    from nonebot_plugin_dcqq_relay.utils import get_file_bytes
+
+    cache = MediaCache(tmp_path, 1024, {"static": 60, "attachment": 60})
+    await cache.put(EMOJI, b"emoji")
+
+    with patch("nonebot_plugin_dcqq_relay.utils.media_cache", cache):
+        async with app.test_api() as ctx:
+            bot, _ = create_bot(ctx)
+            assert await get_file_bytes(bot, EMOJI) == b"emoji"
@@ -0,0 +1,278 @@
+from nonebug import App
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_save_write_through(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.store import (
+        Scope,
+        dc_to_qq_cache,
+        delete_by_dcid,
+        get_dcids,
+        get_qqids,
+        qq_to_dc_cache,
+        save_msgids,
+    )
+
+    scope = Scope(qq_group_id=10001, dc_channel_id=2, qq_bot_id=10001)
+    await save_msgids(scope, [(101, 11), (101, 12)])
+
+    assert await get_qqids(101, dc_channel_id=2) == (11, 12)
+    assert await get_dcids(11, qq_group_id=10001, qq_bot_id=10001) == (101,)
+    assert dc_to_qq_cache.stats()["hits"] == 1
+    assert qq_to_dc_cache.stats()["hits"] == 1
+
+    await delete_by_dcid(scope, 101, (11, 12))
+
+
+@pytest.mark.asyncio
+async def test_miss_reads_database(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.model import MsgID
+    from nonebot_plugin_dcqq_relay.store import (
+        Scope,
+        delete_by_qqid,
+        get_dcids,
+        qq_to_dc_cache,
+    )
+
+    from nonebot_plugin_orm import get_session
+
+    async with get_session() as session:
+        session.add(MsgID(dcid=202, qqid=21))
+        await session.commit()
+
+    assert await get_dcids(21, qq_group_id=10001) == (202,)
+    assert await get_dcids(21, qq_group_id=10001) == (202,)
+    assert qq_to_dc_cache.stats()["misses"] == 1
+    assert qq_to_dc_cache.stats()["hit_ratio"] == 0.5
+    assert await get_dcids(22, qq_group_id=10001) == ()
+
+    await delete_by_qqid(Scope(10001, 2), 21, (202,))
+
+
+@pytest.mark.asyncio
+async def test_delete_evicts(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.store import (
+        Scope,
+        delete_by_dcid,
+        get_dcids,
+        get_qqids,
+        save_msgids,
+    )
+
+    scope = Scope(10001, 2, 10001)
+    await save_msgids(scope, [(303, 31), (303, 32)])
+    await delete_by_dcid(scope, 303, (31, 32))
+
+    assert await get_qqids(303, dc_channel_id=2) == ()
+    assert await get_dcids(31, qq_group_id=10001, qq_bot_id=10001) == ()
+
+
+@pytest.mark.asyncio
+async def test_scope_and_idempotent_save(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.model import MsgID
+    from nonebot_plugin_dcqq_relay.store import (
+        Scope,
+        delete_by_qqid,
+        get_dcids,
+        qq_to_dc_cache,
+        save_msgids,
+    )
+
+    from nonebot_plugin_orm import get_session
+    from sqlalchemy import func, select
+
+    scope = Scope(10001, 2, 10001)
+    other = Scope(10002, 3, 10001)
+    await save_msgids(scope, [(501, 51)])
+    await save_msgids(scope, [(501, 51)])
+    await save_msgids(other, [(502, 51)])
+    qq_to_dc_cache.clear()
+
+    assert await get_dcids(51, qq_group_id=10001, qq_bot_id=10001) == (501,)
+    assert await get_dcids(51, qq_group_id=10002, qq_bot_id=10001) == (502,)
+    assert await get_dcids(51, qq_group_id=10001, qq_bot_id=20002) == ()
+    async with get_session() as session:
+        assert await session.scalar(select(func.count()).filter(MsgID.qqid == 51)) == 2
+
+    await delete_by_qqid(scope, 51, (501,))
+    await delete_by_qqid(other, 51, (502,))
+
+
+def test_lru_capacity(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.cache import LRUCache
+
+    cache: LRUCache[int, int] = LRUCache(2)
+    cache.set(1, 1)
+    cache.set(2, 2)
+    assert cache.get(1) == 1
+    cache.set(3, 3)
+    assert 2 not in cache
+    assert cache.get(1) == 1
+    assert cache.get(3) == 3
+
+
+def test_lru_ttl(app: App) -> None:
+    from unittest.mock import patch
+
+    from nonebot_plugin_dcqq_relay.cache import LRUCache
+
+    cache: LRUCache[int, int] = LRUCache(2, ttl=10)
+    with patch("nonebot_plugin_dcqq_relay.cache.monotonic", return_value=0):
+        cache.set(1, 1)
+        cache.set(2, 2, ttl=1)
+    with patch("nonebot_plugin_dcqq_relay.cache.monotonic", return_value=5):
+        # 单独指定的过期时间先到期
+        assert cache.get(2) is None
+        assert cache.get(1) == 1
+    with patch("nonebot_plugin_dcqq_relay.cache.monotonic", return_value=10):
+        assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_write_behind(app: App) -> None:
+    import asyncio
+    from unittest.mock import patch
+
+    from nonebot_plugin_dcqq_relay.model import MsgID
+    from nonebot_plugin_dcqq_relay.store import (
+        Scope,
+        WriteBehind,
+        dc_to_qq_cache,
+        delete_by_dcid,
+        flush,
+        get_qqids,
+        save_msgids,
+    )
+
+    from nonebot_plugin_orm import get_session
+    from sqlalchemy import func, select
+
+    async def count() -> int:
+        async with get_session() as session:
+            return (
+                await session.scalar(
+                    select(func.count()).filter(MsgID.dcid.in_((401, 402, 403)))
+                )
+                or 0
+            )
+
+    scope = Scope(10001, 2, 10001)
+    write_behind = WriteBehind(interval=0.05, rows=3)
+    with patch("nonebot_plugin_dcqq_relay.store.write_behind", write_behind):
+        await save_msgids(scope, [(401, 41)])
+        await save_msgids(scope, [(402, 42)])
+        assert await count() == 0
+
+        # 缓存被淘汰后仍能从缓冲区中读到
+        dc_to_qq_cache.clear()
+        assert await get_qqids(401, dc_channel_id=2) == (41,)
+
+        await asyncio.sleep(0.1)
+        assert await count() == 2
+
+        await save_msgids(scope, [(403, 43), (403, 44), (403, 45)])
+        assert write_behind.pending == []
+        assert await count() == 5
+
+        await save_msgids(scope, [(401, 46)])
+        await flush()
+        assert await count() == 6
+
+        for dcid in (401, 402, 403):
+            await delete_by_dcid(scope, dcid, ())
+        assert await count() == 0
+
+    # 写入过程中到达的删除等这批插入提交后再执行
+    from nonebot_plugin_dcqq_relay.store import _upsert
+
+    async def slow_upsert(rows: list) -> None:
+        await asyncio.sleep(0.05)
+        await _upsert(rows)
+
+    with (
+        patch("nonebot_plugin_dcqq_relay.store.write_behind", write_behind),
+        patch("nonebot_plugin_dcqq_relay.store._upsert", slow_upsert),
+    ):
+        await save_msgids(scope, [(401, 47)])
+        flushing = asyncio.create_task(flush())
+        await asyncio.sleep(0.01)
+        await delete_by_dcid(scope, 401, (47,))
+        await flushing
+        assert await count() == 0
+
+
+@pytest.mark.asyncio
+async def test_write_behind_flush_error(app: App) -> None:
+    import asyncio
+    from unittest.mock import patch
+
+    from nonebot_plugin_dcqq_relay.store import (
+        Scope,
+        WriteBehind,
+        _upsert,
+        delete_by_dcid,
+        flush,
+    )
+
+    failures = 1
+
+    async def flaky_upsert(rows: list) -> None:
+        nonlocal failures
+        if failures:
+            failures -= 1
+            raise OSError("database is locked")
+        await _upsert(rows)
+
+    scope = Scope(10001, 2, 10001)
+    write_behind = WriteBehind(interval=0.05, rows=1)
+    with (
+        patch("nonebot_plugin_dcqq_relay.store.write_behind", write_behind),
+        patch("nonebot_plugin_dcqq_relay.store._upsert", flaky_upsert),
+    ):
+        # 攒够行数时的写入失败不传给调用方，由定时器重试
+        await write_behind.add(scope, [(501, 51)])
+        assert len(write_behind.pending) == 1
+
+        await asyncio.sleep(0.1)
+        assert write_behind.pending == []
+        await flush()
+    await delete_by_dcid(scope, 501, (51,))
+
+
+@pytest.mark.asyncio
+async def test_prune(app: App) -> None:
+    from datetime import datetime, timedelta, timezone
+
+    from nonebot_plugin_dcqq_relay.store import (
+        Scope,
+        delete_by_dcid,
+        get_qqids,
+        prune,
+        save_msgids,
+        snowflake_at,
+    )
+
+    scope = Scope(10001, 2, 10001)
+    now = datetime.now(timezone.utc)
+    old = [snowflake_at(now - timedelta(days=40 - i)) for i in range(5)]
+    new = snowflake_at(now)
+    await save_msgids(scope, [(dcid, i) for i, dcid in enumerate(old)])
+    await save_msgids(scope, [(new, 99)])
+
+    removed, elapsed = await prune(
+        snowflake_at(now - timedelta(days=30)), chunk=2, vacuum=True
+    )
+
+    assert removed == 5
+    assert elapsed >= 0
+    assert await get_qqids(old[-1], dc_channel_id=2) == ()
+    assert await get_qqids(new, dc_channel_id=2) == (99,)
+
+    # 批大小不大于 0 时按 1 处理
+    await save_msgids(scope, [(dcid, i) for i, dcid in enumerate(old)])
+    removed, _ = await prune(snowflake_at(now - timedelta(days=30)), chunk=0)
+    assert removed == 5
+
+    await delete_by_dcid(scope, new, (99,))
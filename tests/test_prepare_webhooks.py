@@ -41,7 +41,15 @@ async def test_link_with_webhook(app: App) -> None:
                 qq_group_id=10003,
             ),
         ]
-        with patch("nonebot_plugin_dcqq_relay.utils.channel_links", channel_links):
+        from nonebot_plugin_dcqq_relay.route import LinkIndex, WebhookRegistry
+
+        with (
+            patch("nonebot_plugin_dcqq_relay.utils.channel_links", channel_links),
+            patch("nonebot_plugin_dcqq_relay.utils.link_index", LinkIndex()),
+            patch(
+                "nonebot_plugin_dcqq_relay.utils.webhook_registry", WebhookRegistry()
+            ),
+        ):
             from nonebot_plugin_dcqq_relay import prepare_webhooks
             import nonebot_plugin_dcqq_relay.utils as utils
 
@@ -72,7 +80,7 @@ async def test_link_with_webhook(app: App) -> None:
             )
             await prepare_webhooks(dc_bot)
 
-            assert utils.with_webhook_links == [
+            assert utils.webhook_registry.links() == [
                 LinkWithWebhook(**channel_links[0].model_dump()),
                 LinkWithWebhook(
                     **channel_links[1].model_dump(exclude_none=True),
@@ -85,3 +93,49 @@ async def test_link_with_webhook(app: App) -> None:
                     webhook_token=str(tokens[0]),
                 ),
             ]
+
+
+@pytest.mark.asyncio
+async def test_reconnect_reuses_registry(app: App) -> None:
+    async with app.test_api() as ctx:
+        from nonebot_plugin_dcqq_relay.config import LinkWithoutWebhook
+        from nonebot_plugin_dcqq_relay.route import LinkIndex, WebhookRegistry
+
+        _, dc_bot = create_bot(ctx)
+        channel_links: list[LinkWithoutWebhook] = [
+            LinkWithoutWebhook(dc_guild_id=1, dc_channel_id=1, qq_group_id=10001),
+            LinkWithoutWebhook(dc_guild_id=1, dc_channel_id=2, qq_group_id=10002),
+        ]
+        registry = WebhookRegistry()
+        with (
+            patch("nonebot_plugin_dcqq_relay.utils.channel_links", channel_links),
+            patch("nonebot_plugin_dcqq_relay.utils.link_index", LinkIndex()),
+            patch("nonebot_plugin_dcqq_relay.utils.webhook_registry", registry),
+        ):
+            from nonebot_plugin_dcqq_relay import prepare_webhooks
+            import nonebot_plugin_dcqq_relay.utils as utils
+
+            ctx.should_call_api(
+                "get_channel_webhooks", {"channel_id": 1}, webhooks_list()
+            )
+            ctx.should_call_api(
+                "get_channel_webhooks", {"channel_id": 2}, exception=Exception()
+            )
+            ctx.should_call_api(
+                "create_webhook",
+                {"channel_id": 2, "name": "2"},
+                exception=Exception(),
+            )
+            await prepare_webhooks(dc_bot)
+            assert len(registry) == 1
+
+            # 重连时只为缺失的频道重新请求
+            ctx.should_call_api(
+                "get_channel_webhooks", {"channel_id": 2}, webhooks_list()
+            )
+            await prepare_webhooks(dc_bot)
+            await prepare_webhooks(dc_bot)
+
+            assert len(registry) == 2
+            assert registry.stats() == {"size": 2, "hits": 3, "misses": 3}
+            assert utils.link_index.get_qq(10002) == registry.links()[1]
@@ -5,7 +5,7 @@ from pydub import AudioSegment
 
 
 def test_wav_to_mp3(app: App) -> None:
-    from nonebot_plugin_dcqq_relay.utils import pydub_transform
+    from nonebot_plugin_dcqq_relay.transcode import pydub_transform
 
     silent = AudioSegment.silent(duration=100)
     buf = BytesIO()
@@ -18,7 +18,7 @@ def test_wav_to_mp3(app: App) -> None:
 
 
 def test_identity_wav(app: App) -> None:
-    from nonebot_plugin_dcqq_relay.utils import pydub_transform
+    from nonebot_plugin_dcqq_relay.transcode import pydub_transform
 
     silent = AudioSegment.silent(duration=50)
     buf = BytesIO()
@@ -1,3 +1,8 @@
+import os
+from pathlib import Path
+import time
+from typing import TYPE_CHECKING
+
 from tests.conftest import create_bot
 from tests.data import test_png_bytes
 
@@ -6,6 +11,9 @@ from nonebug import App
 import pytest
 from sqlalchemy.util import b64encode
 
+if TYPE_CHECKING:
+    from nonebot_plugin_dcqq_relay.staging import StagingDir
+
 
 def test_split_messages() -> None:
     from nonebot_plugin_dcqq_relay.dc_to_qq import split_messages
@@ -55,14 +63,17 @@ async def test_napcat(app: App) -> None:
 
 
 @pytest.mark.asyncio
-async def test_lagrange(app: App) -> None:
-    from nonebot_plugin_dcqq_relay.dc_to_qq import cache_dir, gather_send
+async def test_lagrange(app: App, upload_staging: "StagingDir") -> None:
+    from hashlib import sha256
+
+    from nonebot_plugin_dcqq_relay.dc_to_qq import gather_send
 
     async with app.test_api() as ctx:
         bot, _ = create_bot(ctx)
         qq_group_id = 1
         file_name = "test.png"
-        file_path = (cache_dir / file_name).as_posix()
+        digest = sha256(test_png_bytes).hexdigest()
+        file_path = (upload_staging.root / f"{digest}.png").as_posix()
         msg_to_send: list[Message] = []
         files = [
             Message(
@@ -80,3 +91,158 @@ async def test_lagrange(app: App) -> None:
             },
         )
         await gather_send(bot, qq_group_id, msg_to_send, files)
+
+    # 发送完成后不再被引用
+    assert not upload_staging.is_pinned(Path(file_path))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("app_name", "mode"),
+    [("NapCat.Onebot", "base64"), ("Lagrange.OneBot", "upload"), ("other", "path")],
+)
+async def test_spooled_media(
+    app: App, tmp_path: Path, upload_staging: "StagingDir", app_name: str, mode: str
+) -> None:
+    from hashlib import sha256
+
+    from nonebot_plugin_dcqq_relay.dc_to_qq import gather_send
+
+    video, file = tmp_path / "video", tmp_path / "file"
+    video.write_bytes(b"video")
+    file.write_bytes(b"file")
+    msg_to_send = [Message(MessageSegment("video", {"file": video}))]
+    files = [Message(MessageSegment("file", {"file": file, "name": "a.txt"}))]
+
+    base64 = {
+        "video": f"base64://{b64encode(b'video')}",
+        "file": f"base64://{b64encode(b'file')}",
+    }
+    paths = {
+        "video": (
+            upload_staging.root / f"{sha256(b'video').hexdigest()}.mp4"
+        ).as_posix(),
+        "file": (upload_staging.root / f"{sha256(b'file').hexdigest()}.txt").as_posix(),
+    }
+
+    async with app.test_api() as ctx:
+        bot, _ = create_bot(ctx)
+        ctx.should_call_api("get_version_info", {}, {"app_name": app_name})
+        # 只有以路径发送时视频才写入暂存目录
+        ctx.should_call_api(
+            "send_group_msg",
+            {
+                "group_id": 1,
+                "message": Message(
+                    MessageSegment(
+                        "video",
+                        {"file": (paths if mode == "path" else base64)["video"]},
+                    )
+                ),
+            },
+            {"message_id": 1},
+        )
+        if mode == "upload":
+            ctx.should_call_api(
+                "upload_group_file",
+                {
+                    "group_id": 1,
+                    "file": paths["file"],
+                    "name": "a.txt",
+                    "folder": "",
+                },
+            )
+        else:
+            ctx.should_call_api(
+                "send_group_msg",
+                {
+                    "group_id": 1,
+                    "message": Message(
+                        MessageSegment(
+                            "file",
+                            {
+                                "file": (paths if mode == "path" else base64)["file"],
+                                "name": "a.txt",
+                            },
+                        )
+                    ),
+                },
+                {"message_id": 2},
+            )
+        await gather_send(bot, 1, msg_to_send, files)
+
+
+@pytest.mark.asyncio
+async def test_file_mode_cached(app: App) -> None:
+    from nonebot_plugin_dcqq_relay import register_bot
+    from nonebot_plugin_dcqq_relay.dc_to_qq import gather_send, get_file_mode
+
+    async with app.test_api() as ctx:
+        bot, _ = create_bot(ctx)
+
+        # 没有文件时不查询实现
+        ctx.should_call_api(
+            "send_group_msg", {"group_id": 1, "message": Message("a")}, None
+        )
+        await gather_send(bot, 1, [Message("a")], [])
+
+        ctx.should_call_api("get_version_info", {}, {"app_name": "NapCat.Onebot"})
+        assert await get_file_mode(bot) == "base64"
+        assert await get_file_mode(bot) == "base64"
+
+        await register_bot(bot)
+        ctx.should_call_api("get_version_info", {}, {"app_name": "Lagrange.OneBot"})
+        assert await get_file_mode(bot) == "upload"
+
+
+@pytest.mark.asyncio
+async def test_save_file(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.staging import StagingDir
+
+    spooled = tmp_path / "spool"
+    spooled.write_bytes(b"video")
+    staging = StagingDir(tmp_path / "up", 1024, 60)
+
+    first = await staging.save(b"video", "a.MP4")
+    # 同名的不同内容不会互相覆盖
+    other = await staging.save(b"other", "a.MP4")
+    # 相同内容复用已暂存的文件，临时文件被删除
+    second = await staging.save(spooled, "b.mp4")
+
+    assert first == second != other
+    assert first.suffix == ".mp4"
+    assert first.read_bytes() == b"video"
+    assert not spooled.exists()
+
+
+def age(path: Path, seconds: float) -> None:
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+@pytest.mark.asyncio
+async def test_cleanup(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.staging import StagingDir
+
+    staging = StagingDir(tmp_path, 10, 3600)
+    expired = await staging.save(b"expired", "a")
+    oldest = await staging.save(b"oldest", "b")
+    newer = await staging.save(b"newer", "c")
+    sending = await staging.save(b"sending", "d")
+    fresh = await staging.save(b"fresh", "e")
+    age(expired, 7200)
+    age(oldest, 300)
+    age(newer, 200)
+    age(sending, 100)
+    staging.release([expired, oldest, newer])
+
+    # 过期的文件被删除，超出容量时从最旧的删起，发送中和刚写入的文件保留
+    assert await staging.cleanup() == (3, 18)
+    assert not expired.exists()
+    assert not oldest.exists()
+    assert not newer.exists()
+    assert sending.exists()
+    assert fresh.exists()
+
+    staging.release([sending])
+    assert await staging.cleanup() == (1, 7)
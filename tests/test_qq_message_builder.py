@@ -6,7 +6,7 @@ from tests.conftest import create_bot, fake_request
 from tests.data import (
     amr_bytes,
     channel,
-    get_test_links,
+    get_test_link_index,
     guild_member,
     guild_message_create_event,
     guild_preview,
@@ -40,8 +40,8 @@ from sqlalchemy.util import b64encode
 @pytest.mark.asyncio
 async def test_handle_reply(app: App) -> None:
     with patch(
-        target="nonebot_plugin_dcqq_relay.utils.with_webhook_links",
-        new_callable=get_test_links,
+        target="nonebot_plugin_dcqq_relay.utils.link_index",
+        new_callable=get_test_link_index,
     ):
         from nonebot_plugin_dcqq_relay import matcher
         from nonebot_plugin_dcqq_relay.model import MsgID
@@ -53,11 +53,6 @@ async def test_handle_reply(app: App) -> None:
 
             ctx.receive_event(dc_bot, guild_message_create_event())
             ctx.should_pass_rule()
-            ctx.should_call_api(
-                api="get_version_info",
-                data={},
-                result={"app_name": "other"},
-            )
             ctx.should_call_api(
                 api="send_group_msg",
                 data=send_group_msg_data(),
@@ -103,7 +98,7 @@ async def test_handle_attachment(app: App, httpserver: HTTPServer) -> None:
         result = await builder.handle_attachment(attachment, bot)
         assert isinstance(result, QQMessageSegment)
         assert result.type == "video"
-        assert result.data["file"] == f"base64://{b64encode(test_png_bytes)}"
+        assert result.data["file"] == test_png_bytes
 
         attachment.content_type = "text/plain"
         result = await builder.handle_attachment(attachment, bot)
@@ -185,6 +180,7 @@ async def test_handle_referenced_message(app: App) -> None:
 @pytest.mark.asyncio
 async def test_handle_message_snapshots(app: App, httpserver: HTTPServer) -> None:
     from nonebot_plugin_dcqq_relay.dc_to_qq import MessageBuilder
+    from nonebot_plugin_dcqq_relay.guilds import guild_store
 
     httpserver.expect_request("/test.png").respond_with_data(test_png_bytes)
     url = httpserver.url_for("/test.png")
@@ -231,6 +227,8 @@ async def test_handle_message_snapshots(app: App, httpserver: HTTPServer) -> Non
 
         event.message_snapshots = [message_snapshot(content, timestamp=timestamp)]
 
+        # 服务器名已缓存，清空后重新查询
+        guild_store.clear()
         ctx.should_call_api(
             api="get_guild_preview",
             data={"guild_id": guild_id},
@@ -363,6 +361,7 @@ async def test_convert_custom_emoji(app: App) -> None:
 @pytest.mark.asyncio
 async def test_convert_mention_user(app: App) -> None:
     from nonebot_plugin_dcqq_relay.dc_to_qq import MessageBuilder
+    from nonebot_plugin_dcqq_relay.utils import invalidate_dc_member
 
     async with app.test_api() as ctx:
         _, bot = create_bot(ctx)
@@ -382,6 +381,8 @@ async def test_convert_mention_user(app: App) -> None:
         assert isinstance(result, QQMessageSegment)
         assert result.data == {"text": f"@{global_name}({username})"}
 
+        # 昵称修改后由网关事件使缓存失效
+        invalidate_dc_member(int("6" * 18), user_id)
         nick = "TT"
         seg = DCMessageSegment.mention_user(user_id)
         ctx.should_call_api(
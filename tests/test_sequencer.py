@@ -0,0 +1,71 @@
+import asyncio
+from unittest.mock import patch
+
+from tests.conftest import create_bot
+from tests.data import get_test_links, group_message_event, guild_message_create_event
+
+from nonebug import App
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_order(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.sequencer import Sequencer
+
+    sequencer: Sequencer[int] = Sequencer()
+    order: list[str] = []
+
+    async def job(name: str, delay: float) -> str:
+        await asyncio.sleep(delay)
+        order.append(name)
+        return name
+
+    results = await asyncio.gather(
+        sequencer.run(1, lambda: job("large image", 0.05)),
+        sequencer.run(1, lambda: job("short text", 0)),
+        sequencer.run(2, lambda: job("other link", 0.01)),
+    )
+
+    # 同一链接按提交顺序完成，不同链接互不阻塞
+    assert results == ["large image", "short text", "other link"]
+    assert order == ["other link", "large image", "short text"]
+    stats = sequencer.stats()
+    assert stats["lanes"] == 0
+    assert stats["completed"] == 3
+    assert stats["max_wait"] >= 0.05
+
+    async def fail() -> None:
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        await sequencer.run(1, fail)
+
+
+@pytest.mark.asyncio
+async def test_direction_lanes(app: App) -> None:
+    from nonebot_plugin_dcqq_relay import message_relay
+
+    link = get_test_links()[0]
+    order: list[str] = []
+    release = asyncio.Event()
+
+    async def fake_relay(bot, event, link, merged=()) -> None:
+        if bot is qq_bot:
+            await release.wait()
+        order.append(bot.type)
+
+    async with app.test_api() as ctx:
+        qq_bot, dc_bot = create_bot(ctx)
+        with patch("nonebot_plugin_dcqq_relay.relay", fake_relay):
+            qq_task = asyncio.create_task(
+                message_relay(qq_bot, group_message_event("qq"), link)
+            )
+            await asyncio.sleep(0)
+            # 同一链接另一方向的消息不必等待 QQ 侧完成
+            await asyncio.wait_for(
+                message_relay(dc_bot, guild_message_create_event(content="dc"), link), 1
+            )
+            release.set()
+            await qq_task
+
+    assert order == [dc_bot.type, qq_bot.type]
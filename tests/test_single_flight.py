@@ -0,0 +1,103 @@
+import asyncio
+
+from nonebug import App
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_coalesce(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.cache import SingleFlight
+
+    flight: SingleFlight[str, int] = SingleFlight()
+    calls = 0
+
+    async def fetch() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(flight.do("a", fetch) for _ in range(5)))
+
+    assert results == [1] * 5
+    assert calls == 1
+    assert flight.stats() == {"in_flight": 0, "coalesced": 4}
+    assert await flight.do("a", fetch) == 2
+
+
+@pytest.mark.asyncio
+async def test_error_shared(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.cache import SingleFlight
+
+    flight: SingleFlight[str, int] = SingleFlight()
+
+    async def fetch() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        flight.do("a", fetch), flight.do("a", fetch), return_exceptions=True
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.cache import SingleFlight
+
+    flight: SingleFlight[str, int] = SingleFlight()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def fetch() -> int:
+        started.set()
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return 1
+
+    first = asyncio.create_task(flight.do("a", fetch))
+    second = asyncio.create_task(flight.do("a", fetch))
+    await started.wait()
+
+    # 仍有等待者时下载继续进行
+    first.cancel()
+    await asyncio.sleep(0)
+    assert not cancelled.is_set()
+    assert len(flight) == 1
+
+    second.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    with pytest.raises(asyncio.CancelledError):
+        await second
+    await asyncio.sleep(0)
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_call_after_cancel(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.cache import SingleFlight
+
+    flight: SingleFlight[str, int] = SingleFlight()
+    started = asyncio.Event()
+
+    async def slow() -> int:
+        started.set()
+        await asyncio.sleep(1)
+        return 1
+
+    async def fast() -> int:
+        return 2
+
+    only = asyncio.create_task(flight.do("a", slow))
+    await started.wait()
+    only.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await only
+
+    # 被取消的调用尚未结束时，新的调用者不受影响
+    assert await flight.do("a", fast) == 2
@@ -4,7 +4,7 @@ from nonebug import App
 
 
 def test_silk_input(app: App) -> None:
-    from nonebot_plugin_dcqq_relay.utils import skil_to_ogg
+    from nonebot_plugin_dcqq_relay.transcode import skil_to_ogg
 
     ogg_bytes = skil_to_ogg(skil_bytes)
     assert isinstance(ogg_bytes, bytes)
@@ -13,7 +13,7 @@ def test_silk_input(app: App) -> None:
 
 
 def test_amr_input(app: App) -> None:
-    from nonebot_plugin_dcqq_relay.utils import skil_to_ogg
+    from nonebot_plugin_dcqq_relay.transcode import skil_to_ogg
 
     ogg_bytes = skil_to_ogg(amr_bytes)
     assert isinstance(ogg_bytes, bytes)
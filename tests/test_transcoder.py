@@ -0,0 +1,196 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+import time
+from unittest.mock import patch
+
+from tests.data import skil_bytes
+
+from nonebug import App
+import pysilk
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_run(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.transcode import Transcoder
+
+    # 只有主线程时以 fork 启动进程池
+    with patch("threading.active_count", return_value=1):
+        transcoder = Transcoder(workers=2, queue_size=1, timeout=10)
+        transcoder.start()
+    try:
+        results = await asyncio.gather(*(transcoder.run(pow, 2, i) for i in range(5)))
+        assert isinstance(transcoder.executor, ProcessPoolExecutor)
+    finally:
+        transcoder.shutdown()
+
+    assert results == [1, 2, 4, 8, 16]
+    stats = transcoder.stats()
+    assert stats["completed"] == 5
+    assert stats["waiting"] == stats["running"] == 0
+    assert stats["max_latency"] >= stats["avg_latency"] > 0
+
+
+@pytest.mark.asyncio
+async def test_timeout_and_error(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.transcode import Transcoder, TranscodeTimeout
+
+    with patch("multiprocessing.get_all_start_methods", return_value=["spawn"]):
+        transcoder = Transcoder(workers=2, queue_size=0, timeout=0.05)
+        assert isinstance(transcoder.executor, ThreadPoolExecutor)
+
+    # 已有其它线程时 fork 不安全，同样改用线程池
+    with patch("threading.active_count", return_value=2):
+        threaded = Transcoder(workers=1, queue_size=0, timeout=1)
+        assert isinstance(threaded.executor, ThreadPoolExecutor)
+    threaded.shutdown()
+    try:
+        with pytest.raises(TranscodeTimeout):
+            await transcoder.run(time.sleep, 0.2)
+        # 超时的任务仍在运行，只剩一个名额
+        assert transcoder.stats()["running"] == 1
+        with pytest.raises(ValueError, match="invalid literal"):
+            await transcoder.run(int, "x")
+    finally:
+        transcoder.shutdown()
+
+    assert transcoder.stats()["timeouts"] == 1
+    assert transcoder.stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_transcode(app: App, tmp_path: Path) -> None:
+    import math
+
+    from nonebot_plugin_dcqq_relay.media import MediaCache
+    from nonebot_plugin_dcqq_relay.transcode import cached_transcode
+
+    async def upper() -> bytes:
+        return b"ABC"
+
+    async def title() -> bytes:
+        return b"Abc"
+
+    cache = MediaCache(tmp_path, 1024, {"transcode": math.inf})
+    with patch("nonebot_plugin_dcqq_relay.transcode.transcode_cache", cache):
+        assert await cached_transcode(b"abc", "ogg", "", "", upper) == b"ABC"
+        assert await cached_transcode(b"abc", "ogg", "", "", title) == b"ABC"
+        assert await cached_transcode(b"abc", "mp3", "", "", title) == b"Abc"
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def fake_ffmpeg(path: Path, script: str) -> str:
+    path.write_text(f"#!/bin/sh\n{script}\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.mark.asyncio
+async def test_ffmpeg_pipe(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.transcode import TranscodeError, ffmpeg_pipe
+
+    ffmpeg = fake_ffmpeg(tmp_path / "ffmpeg", 'echo "$@" >&2; tr a-z A-Z')
+    with patch("nonebot_plugin_dcqq_relay.transcode.FFMPEG", ffmpeg):
+        assert await ffmpeg_pipe(b"abc", [], ["-f", "ogg"]) == b"ABC"
+
+    ffmpeg = fake_ffmpeg(tmp_path / "broken", "echo bad input >&2; exit 1")
+    with (
+        patch("nonebot_plugin_dcqq_relay.transcode.FFMPEG", ffmpeg),
+        pytest.raises(TranscodeError, match="bad input"),
+    ):
+        await ffmpeg_pipe(b"abc", [], ["-f", "ogg"])
+
+    # 超时被取消时杀死并回收 ffmpeg
+    procs: list[asyncio.subprocess.Process] = []
+    create = asyncio.create_subprocess_exec
+
+    async def spy(*args, **kwargs) -> asyncio.subprocess.Process:
+        procs.append(await create(*args, **kwargs))
+        return procs[-1]
+
+    ffmpeg = fake_ffmpeg(tmp_path / "slow", "exec sleep 10")
+    with (
+        patch("nonebot_plugin_dcqq_relay.transcode.FFMPEG", ffmpeg),
+        patch("asyncio.create_subprocess_exec", spy),
+        pytest.raises(asyncio.TimeoutError),
+    ):
+        await asyncio.wait_for(ffmpeg_pipe(b"abc", [], []), 0.2)
+    assert procs[0].returncode is not None
+
+
+@pytest.mark.asyncio
+async def test_pipe_fallback(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.transcode import ffmpeg_pipe, pipe_or_pool
+
+    ffmpeg = fake_ffmpeg(tmp_path / "broken", "exit 1")
+    with patch("nonebot_plugin_dcqq_relay.transcode.FFMPEG", ffmpeg):
+        result = await pipe_or_pool(
+            lambda: ffmpeg_pipe(b"abc", [], []), bytes.upper, b"abc"
+        )
+    assert result == b"ABC"
+
+
+@pytest.mark.asyncio
+async def test_timeout_holds_slot(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.transcode import Transcoder, TranscodeTimeout
+
+    with patch("multiprocessing.get_all_start_methods", return_value=["spawn"]):
+        transcoder = Transcoder(workers=1, queue_size=0, timeout=0.05)
+    try:
+        with pytest.raises(TranscodeTimeout):
+            await transcoder.run(time.sleep, 0.2)
+        # 超时的任务结束前，新任务只能排队
+        with pytest.raises(TranscodeTimeout):
+            await transcoder.run(int, "1")
+        assert transcoder.stats()["running"] == 1
+
+        await asyncio.sleep(0.2)
+        assert transcoder.stats()["running"] == 0
+        assert await transcoder.run(int, "1") == 1
+    finally:
+        transcoder.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_silk_in_pool(app: App, tmp_path: Path) -> None:
+    from nonebot_plugin_dcqq_relay.transcode import Transcoder, ffmpeg_to_ogg
+
+    # silk 在任务中解码，PCM 直接写入 ffmpeg
+    ffmpeg = fake_ffmpeg(tmp_path / "ffmpeg", 'echo "$5"; wc -c')
+    with patch("multiprocessing.get_all_start_methods", return_value=["spawn"]):
+        transcoder = Transcoder(workers=1, queue_size=0, timeout=10)
+    try:
+        with (
+            patch("nonebot_plugin_dcqq_relay.transcode.FFMPEG", ffmpeg),
+            patch("nonebot_plugin_dcqq_relay.transcode.transcoder", transcoder),
+        ):
+            result = await ffmpeg_to_ogg(skil_bytes)
+    finally:
+        transcoder.shutdown()
+
+    pcm = pysilk.decode(skil_bytes, sample_rate=24000)
+    assert result.split() == [b"s16le", str(len(pcm)).encode()]
+    assert transcoder.stats()["completed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_broken_pool(app: App) -> None:
+    import os
+
+    from nonebot_plugin_dcqq_relay.transcode import TranscodeError, Transcoder
+
+    with patch("threading.active_count", return_value=1):
+        transcoder = Transcoder(workers=1, queue_size=0, timeout=10)
+        transcoder.start()
+    try:
+        # 子进程崩溃后丢弃进程池，下次调用时重新创建
+        with pytest.raises(TranscodeError, match="pool broken"):
+            await transcoder.run(os._exit, 1)
+        assert await transcoder.run(pow, 2, 3) == 8
+    finally:
+        transcoder.shutdown()
+
+    assert transcoder.stats()["broken"] == 1
@@ -0,0 +1,99 @@
+import asyncio
+from time import monotonic
+
+from nonebot.adapters.discord.exception import RateLimitException
+from nonebot.drivers import Response
+from nonebug import App
+import pytest
+
+
+class FakeBot:
+    self_id = "12345"
+
+    def __init__(self, rate_limited: int = 0):
+        self.calls: list[tuple[float, str]] = []
+        self.rate_limited = rate_limited
+
+    async def execute_webhook(self, webhook_id: int, token: str, content: str):
+        if self.rate_limited:
+            self.rate_limited -= 1
+            raise RateLimitException(
+                Response(429, content=b'{"message": "You are being rate limited."}')
+            )
+        self.calls.append((monotonic(), content))
+        return content
+
+
+def test_bucket(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.ratelimit import Bucket
+
+    bucket = Bucket(2, 1)
+    assert bucket.delay(0) == 0
+    bucket.acquire(0)
+    bucket.acquire(0.5)
+    assert bucket.delay(0.5) == 0.5
+    assert bucket.stats(0.5) == {"limit": 2, "remaining": 0, "reset_after": 0.5}
+    assert bucket.delay(1) == 0
+    bucket.block(3)
+    assert bucket.delay(1) == 2
+
+    # 上限为 0 时不限制请求数
+    unlimited = Bucket(0, 1)
+    for now in (0, 0, 0):
+        assert unlimited.delay(now) == 0
+        unlimited.acquire(now)
+
+
+@pytest.mark.asyncio
+async def test_paced_in_order(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.ratelimit import WebhookSender
+
+    sender = WebhookSender(2, 0.1, 50, 0)
+    bot = FakeBot()
+    start = monotonic()
+    results = await asyncio.gather(
+        *(sender.execute(bot, 1, "t", content=str(i)) for i in range(5))  # type: ignore
+    )
+
+    assert results == [str(i) for i in range(5)]
+    assert [content for _, content in bot.calls] == results
+    # 第 3、5 次请求需等待窗口滑过
+    times = [sent - start for sent, _ in bot.calls]
+    assert times[1] < 0.05
+    assert times[2] >= 0.1
+    assert times[4] >= 0.2
+    stats = sender.stats()
+    assert stats["sent"] == 5
+    assert stats["max_wait"] >= 0.2
+    assert stats["webhooks"][1]["limit"] == 2
+
+
+@pytest.mark.asyncio
+async def test_global_bucket(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.ratelimit import WebhookSender
+
+    sender = WebhookSender(5, 1, 2, 0)
+    bot = FakeBot()
+    start = monotonic()
+    await asyncio.gather(
+        *(sender.execute(bot, i, "t", content=str(i)) for i in range(3))  # type: ignore
+    )
+    # 不同 webhook 共享机器人的全局桶
+    assert bot.calls[2][0] - start >= 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_retry(app: App) -> None:
+    from nonebot_plugin_dcqq_relay.ratelimit import WebhookSender
+
+    sender = WebhookSender(5, 0.05, 50, 2)
+    bot = FakeBot(rate_limited=2)
+    start = monotonic()
+    assert await sender.execute(bot, 1, "t", content="a") == "a"  # type: ignore
+    # 依次退避 0.05、0.1 秒
+    assert bot.calls[0][0] - start >= 0.15
+    assert sender.stats()["rate_limited"] == 2
+
+    bot.rate_limited = 3
+    with pytest.raises(RateLimitException, match="rate limited"):
+        await sender.execute(bot, 1, "t", content="b")  # type: ignore